@@ -0,0 +1,177 @@
+import threading
+import queue
+import time
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ('args', 'future', 'enqueued')
+
+    def __init__(self, args):
+        self.args = args
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class MicroBatcher:
+    """Groups single-item inference calls into one batched forward pass.
+
+    Callers submit un-batched tensors (C, H, W) and get a Future for their own
+    slice of the output. A batch is flushed when it reaches max_batch_size or
+    when the oldest job has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, name, forward, max_batch_size=8, max_wait_ms=5.0, max_queue=256, num_runners=1):
+        self.name = name
+        self.forward = forward
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(1, int(max_queue))
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'batches': 0,
+            'queue_wait_total': 0.0,
+            'forward_total': 0.0,
+            'max_batch_seen': 0,
+        }
+        self._running = True
+        self._runners = []
+        for i in range(max(1, int(num_runners))):
+            t = threading.Thread(target=self._loop, name=f'{name}-batcher-{i}', daemon=True)
+            t.start()
+            self._runners.append(t)
+
+    def submit(self, *args):
+        job = _Job(args)
+        # Under the lock, so close() can't drain the queue between the check and the put
+        with self._lock:
+            if not self._running:
+                raise RuntimeError(f'{self.name} batcher is closed')
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._stats['rejected'] += 1
+                raise QueueFull(f'{self.name} queue is full ({self.max_queue} pending)')
+            self._stats['submitted'] += 1
+        return job.future
+
+    def run(self, *args, timeout=None):
+        return self.submit(*args).result(timeout=timeout)
+
+    def _collect(self, first):
+        """(batch, stop): stop is set when this runner took its close() sentinel."""
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # Run what was collected, then stop; putting the sentinel back could block on a full queue
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch, stop = self._collect(job)
+            self._run(batch)
+            if stop:
+                break
+
+    def _run(self, batch):
+        # torch is imported here so the server can import QueueFull without paying for torch
+        import torch
+        # Jobs with different input shapes can't share a stacked tensor
+        groups = {}
+        for job in batch:
+            key = tuple(tuple(a.shape) for a in job.args)
+            groups.setdefault(key, []).append(job)
+
+        for jobs in groups.values():
+            started = time.monotonic()
+            try:
+                stacked = [torch.stack([j.args[i] for j in jobs]) for i in range(len(jobs[0].args))]
+                with torch.no_grad():
+                    out = self.forward(*stacked)
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(jobs)} failed: {e}")
+                for j in jobs:
+                    j.future.set_exception(e)
+                with self._lock:
+                    self._stats['failed'] += len(jobs)
+                continue
+            finished = time.monotonic()
+            for i, j in enumerate(jobs):
+                j.future.set_result(out[i])
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['completed'] += len(jobs)
+                self._stats['forward_total'] += finished - started
+                self._stats['queue_wait_total'] += sum(started - j.enqueued for j in jobs)
+                self._stats['max_batch_seen'] = max(self._stats['max_batch_seen'], len(jobs))
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        batches = s.pop('batches')
+        completed = s['completed']
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'max_queue': self.max_queue,
+            'queue_depth': self._queue.qsize(),
+            'batches': batches,
+            'submitted': s['submitted'],
+            'completed': completed,
+            'failed': s['failed'],
+            'rejected': s['rejected'],
+            'max_batch_seen': s['max_batch_seen'],
+            'avg_batch_size': round(completed / batches, 3) if batches else 0.0,
+            'avg_queue_wait_ms': round(s['queue_wait_total'] / completed * 1000.0, 3) if completed else 0.0,
+            'avg_forward_ms': round(s['forward_total'] / batches * 1000.0, 3) if batches else 0.0,
+        }
+
+    def close(self, timeout=5.0):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        for _ in self._runners:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for t in self._runners:
+            t.join(timeout)
+        # Jobs queued behind the sentinels (or left by runners that didn't stop in time) never run
+        closed = 0
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and job.future.set_running_or_notify_cancel():
+                job.future.set_exception(RuntimeError(f'{self.name} batcher closed'))
+                closed += 1
+        if closed:
+            with self._lock:
+                self._stats['failed'] += closed
+            logger.warning(f"{self.name} batcher closed with {closed} jobs still queued")
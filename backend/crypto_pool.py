@@ -0,0 +1,157 @@
+"""Bounded executor for CPU-heavy crypto (PBKDF2, bcrypt) and a derived-key cache.
+
+hashlib's PBKDF2 and bcrypt both release the GIL, so the pool threads run in
+parallel with the web threads instead of stalling them.
+"""
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class CryptoBusy(Exception):
+    pass
+
+
+class CryptoTimeout(CryptoBusy):
+    # The call is still running on the pool; callers answer it like a saturated pool
+    pass
+
+
+def pbkdf2_key(password, salt, iterations=100000):
+    # Same derivation as cryptography's PBKDF2HMAC(SHA256, length=32), as a Fernet key
+    raw = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, 32)
+    return base64.urlsafe_b64encode(raw)
+
+
+class CryptoPool:
+    """Runs crypto calls on a fixed set of threads with a bounded backlog.
+
+    run() blocks the caller until the result is ready, but raises CryptoBusy
+    straight away when max_workers + max_pending calls are already in flight,
+    and CryptoTimeout when the result takes longer than timeout. A call counts
+    as in flight until it finishes on the pool, even if its caller gave up.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(0, int(max_pending))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='crypto')
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+                       'timeouts': 0, 'max_in_flight': 0, 'queue_wait_total': 0.0}
+        self._ops = {}
+
+    def run(self, op, fn, *args, timeout=None):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                self._stats['rejected'] += 1
+                raise CryptoBusy(f'Crypto pool is saturated ({self._in_flight} in flight)')
+            self._in_flight += 1
+            self._stats['submitted'] += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+        enqueued = time.perf_counter()
+        try:
+            future = self._executor.submit(self._call, op, fn, args, enqueued)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise CryptoTimeout(f'{op} did not finish within {timeout}s')
+
+    def _release(self, future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _call(self, op, fn, args, enqueued):
+        started = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            with self._lock:
+                self._stats['failed'] += 1
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['queue_wait_total'] += started - enqueued
+            count, total, worst = self._ops.get(op, (0, 0.0, 0.0))
+            self._ops[op] = (count + 1, total + elapsed, max(worst, elapsed))
+        return result
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['in_flight'] = self._in_flight
+            ops = dict(self._ops)
+        wait_total = s.pop('queue_wait_total')
+        s['avg_queue_wait_ms'] = round(wait_total / s['completed'] * 1000.0, 3) if s['completed'] else 0.0
+        s['saturation'] = round(s['in_flight'] / (self.max_workers + self.max_pending), 3)
+        s['max_workers'] = self.max_workers
+        s['max_pending'] = self.max_pending
+        s['ops'] = {op: {'count': c, 'avg_ms': round(t / c * 1000.0, 3), 'max_ms': round(w * 1000.0, 3)}
+                    for op, (c, t, w) in ops.items()}
+        return s
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class DerivedKeyCache:
+    """TTL + LRU cache of derived keys, keyed by (sha256(salt + password), salt).
+
+    The plaintext password is never stored; entries expire ttl seconds after insertion.
+    """
+
+    def __init__(self, ttl=600, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max(0, int(max_entries))
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+    @staticmethod
+    def _key(password, salt):
+        return hashlib.sha256(salt + password.encode()).digest(), salt
+
+    def get(self, password, salt):
+        key = self._key(password, salt)
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] <= now:
+                del self._items[key]
+                self._stats['expired'] += 1
+                item = None
+            if item is None:
+                self._stats['misses'] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats['hits'] += 1
+            return item[0]
+
+    def put(self, password, salt, derived):
+        if not self.max_entries or self.ttl <= 0:
+            return
+        key = self._key(password, salt)
+        with self._lock:
+            self._items[key] = (derived, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats, entries=len(self._items))
+        s['ttl'] = self.ttl
+        s['max_entries'] = self.max_entries
+        return s
@@ -0,0 +1,146 @@
+"""Engine settings for the message database.
+
+SQLite (the single-node default) runs in WAL mode with a busy timeout, so
+/messages readers are not blocked by encode writers and concurrent writers
+wait for the lock instead of failing. Server databases (STEGO_DATABASE_URL
+set to postgresql://..., mysql://...) get a bounded, pre-pinged connection pool.
+
+    python backend/database.py --writers 1 4 8 --inserts 200
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+import datetime
+
+from sqlalchemy import create_engine, event, select, or_, and_, tuple_
+from sqlalchemy.engine import make_url
+
+SQLITE_JOURNAL_MODE = os.environ.get('STEGO_SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('STEGO_SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('STEGO_SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_MB = int(os.environ.get('STEGO_SQLITE_CACHE_MB', 16))
+DB_POOL_SIZE = int(os.environ.get('STEGO_DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('STEGO_DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('STEGO_DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('STEGO_DB_POOL_RECYCLE', 1800))
+
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def engine_options(url):
+    """create_engine() keyword arguments (SQLALCHEMY_ENGINE_OPTIONS) for a database URL."""
+    if is_sqlite(url):
+        if make_url(url).database in (None, '', ':memory:'):
+            # In-memory databases live in a single connection
+            return {}
+        # Writers serialise on the database lock; a few pooled connections are plenty
+        return {'pool_size': DB_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW, 'pool_timeout': DB_POOL_TIMEOUT,
+                'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000.0}}
+    return {'pool_size': DB_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW, 'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE, 'pool_pre_ping': True}
+
+
+def install_sqlite_pragmas(engine, journal_mode=None, synchronous=None):
+    """Sets the per-connection pragmas on every new SQLite connection of engine (no-op for other databases)."""
+    if engine.dialect.name != 'sqlite':
+        return
+    journal_mode = journal_mode or SQLITE_JOURNAL_MODE
+    synchronous = synchronous or SQLITE_SYNCHRONOUS
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        # WAL is persistent in the file; the other pragmas are per connection
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA cache_size={-SQLITE_CACHE_MB * 1024}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _bench(url, writers, inserts, journal_mode, synchronous, seed_rows=2000):
+    from db_models import Message
+    from migrations import upgrade
+
+    engine = create_engine(url, **engine_options(url))
+    install_sqlite_pragmas(engine, journal_mode, synchronous)
+    upgrade(engine, log=lambda message: None)
+    table = Message.__table__
+    now = datetime.datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [{'sender': f'u{i % 50}', 'receiver': f'u{(i + 1) % 50}',
+                                       'timestamp': now + datetime.timedelta(milliseconds=i),
+                                       'stego_image_filename': f'{i:064x}.png', 'is_encrypted': False}
+                                      for i in range(seed_rows)])
+
+    latest = select(table).order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(51)
+    conversation = latest.where(or_(and_(table.c.sender == 'u1', table.c.receiver == 'u2'),
+                                    and_(table.c.sender == 'u2', table.c.receiver == 'u1')))
+    older = latest.where(tuple_(table.c.timestamp, table.c.id) < (now + datetime.timedelta(seconds=1), 1000))
+    errors = [0]
+    done = threading.Event()
+    read_ms = []
+
+    def write(worker):
+        for i in range(inserts):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(table.insert().values(
+                        sender=f'w{worker}', receiver='u1', timestamp=datetime.datetime.utcnow(),
+                        stego_image_filename=f'{worker:08x}{i:056x}.png', is_encrypted=False))
+            except Exception:
+                errors[0] += 1
+
+    def read():
+        queries = (latest, conversation, older)
+        n = 0
+        while not done.is_set():
+            started = time.perf_counter()
+            with engine.connect() as conn:
+                conn.execute(queries[n % len(queries)]).fetchall()
+            read_ms.append((time.perf_counter() - started) * 1000)
+            n += 1
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    reader.join()
+    engine.dispose()
+    return {'inserts_per_s': round((writers * inserts - errors[0]) / elapsed, 1), 'write_errors': errors[0],
+            'reads': len(read_ms), 'read_p50_ms': round(_percentile(read_ms, 0.5), 3),
+            'read_p95_ms': round(_percentile(read_ms, 0.95), 3), 'read_max_ms': round(max(read_ms, default=0), 3)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Message insert throughput and read latency under parallel writers')
+    parser.add_argument('--url', default=None, help='scratch database URL (rows are inserted); default: a temporary SQLite file per run')
+    parser.add_argument('--writers', nargs='+', type=int, default=[1, 4, 8])
+    parser.add_argument('--inserts', type=int, default=200, help='inserts per writer')
+    args = parser.parse_args()
+
+    # Rollback journal with full sync (SQLite's defaults) vs. the tuned WAL settings
+    modes = [('DELETE', 'FULL'), ('WAL', 'NORMAL')] if args.url is None or is_sqlite(args.url) else [(None, None)]
+    for journal_mode, synchronous in modes:
+        for writers in args.writers:
+            with tempfile.TemporaryDirectory() as tmp:
+                url = args.url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+                result = _bench(url, writers, args.inserts, journal_mode, synchronous)
+            print(f"journal={journal_mode or '-'} sync={synchronous or '-'} writers={writers}: {result}")
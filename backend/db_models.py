@@ -9,6 +9,15 @@ class User(db.Model):
     password_hash = db.Column(db.String(128), nullable=False)
 
 class Message(db.Model):
+    # Composite indexes back keyset pagination on (timestamp, id), overall and per conversation
+    __table_args__ = (
+        db.Index('ix_message_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_message_sender_receiver_timestamp_id', 'sender', 'receiver', 'timestamp', 'id'),
+        db.Index('ix_message_receiver_timestamp_id', 'receiver', 'timestamp', 'id'),
+        # Stored-image lookups (dedup, reconciling storage against the table)
+        db.Index('ix_message_stego_image_filename', 'stego_image_filename'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     sender = db.Column(db.String(50), nullable=False)
     receiver = db.Column(db.String(50), nullable=False)
@@ -18,6 +27,10 @@ class Message(db.Model):
     
     # Metadata
     is_encrypted = db.Column(db.Boolean, default=False)
+    # How the secret is carried: 'image' (an upload or rendered text) or 'binary' (payload.py)
+    payload_format = db.Column(db.String(16), nullable=False, default='image', server_default='image')
+    # Encoder version that produced the stego (model_registry.py); decodes use the matching decoder
+    model_version = db.Column(db.String(64), nullable=False, default='default', server_default='default')
     
     def to_dict(self):
         return {
@@ -27,5 +40,8 @@ class Message(db.Model):
             'timestamp': self.timestamp.strftime('%I:%M %p'),
             'stego_image_filename': self.stego_image_filename,
             'is_encrypted': self.is_encrypted,
+            'payload_format': self.payload_format,
+            'model_version': self.model_version,
             'decodedContent': None
         }
+
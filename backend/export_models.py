@@ -0,0 +1,57 @@
+"""Exports the encoder/decoder checkpoints as TorchScript artifacts.
+
+The server loads these instead of rebuilding the networks from Python source:
+
+    python backend/export_models.py [--checkpoint-dir DIR] [--img-size 128]
+"""
+import os
+import time
+import argparse
+import logging
+
+import torch
+
+from model_loader import CHECKPOINT_DIR, load_state_dicts, build_models, scripted_paths
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def export(checkpoint_dir=CHECKPOINT_DIR, img_size=128):
+    device = torch.device('cpu')
+    encoder_state, decoder_state = load_state_dicts(checkpoint_dir)
+    if encoder_state is None:
+        raise SystemExit(f"No checkpoints found in {checkpoint_dir}; nothing to export.")
+    encoder, decoder = build_models(device, encoder_state, decoder_state)
+
+    # Trace with a batch > 1 so the artifact isn't specialised to single-image batches
+    cover = torch.zeros(2, 3, img_size, img_size)
+    secret = torch.zeros(2, 3, img_size, img_size)
+    with torch.no_grad():
+        encoder_ts = torch.jit.freeze(torch.jit.trace(encoder, (cover, secret)))
+        decoder_ts = torch.jit.freeze(torch.jit.trace(decoder, cover))
+
+        # Sanity check against the eager models before writing anything
+        probe = torch.rand(3, 3, img_size, img_size) * 2 - 1
+        enc_err = (encoder_ts(probe, probe) - encoder(probe, probe)).abs().max().item()
+        dec_err = (decoder_ts(probe) - decoder(probe)).abs().max().item()
+    if max(enc_err, dec_err) > 1e-4:
+        raise SystemExit(f"Traced models diverge from eager models (encoder {enc_err:.2e}, decoder {dec_err:.2e})")
+
+    encoder_path, decoder_path = scripted_paths(checkpoint_dir)
+    for module, path in ((encoder_ts, encoder_path), (decoder_ts, decoder_path)):
+        tmp = path + '.tmp'
+        torch.jit.save(module, tmp)
+        os.replace(tmp, path)
+        logger.info(f"Wrote {path}")
+    return encoder_path, decoder_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export StegoChat checkpoints to TorchScript')
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR)
+    parser.add_argument('--img-size', type=int, default=128)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    export(args.checkpoint_dir, args.img_size)
+    logger.info(f"Export finished in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,252 @@
+"""Image decode/encode path shared by every endpoint.
+
+Decoded images are pasted straight into per-thread preallocated uint8 staging
+buffers (PIL writes through a shared-memory view of them) and normalised into
+the model tensor in place. On the way out, model tensors are denormalised into
+per-thread float/uint8 buffers and PNG-encoded from that contiguous array.
+
+Staging buffers are reused by the next call on the same thread, so nothing
+that escapes a call may point into them: to_tensor() returns a fresh tensor
+(it outlives the request in the batchers and caches), and to_uint8() views
+are only valid until the thread's next to_uint8().
+
+    python backend/image_io.py --size 128 --iters 200
+"""
+import io
+import os
+import time
+import base64
+import argparse
+import threading
+
+import numpy as np
+from PIL import Image
+
+PNG_COMPRESS_LEVEL = int(os.environ.get('STEGO_PNG_COMPRESS_LEVEL', 6))
+
+# Above this downscale factor, resize() first shrinks by an integer factor with
+# Image.reduce() (box filter on the raw pixels), then resamples the rest
+RESIZE_REDUCING_GAP = 3.0
+
+_local = threading.local()
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def _staging(name, shape, dtype=np.uint8):
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    key = (name, shape)
+    buf = buffers.get(key)
+    if buf is None:
+        buf = buffers[key] = np.empty(shape, dtype=dtype)
+    return buf
+
+
+def _rgba_view(buf):
+    # A PIL image sharing buf's memory; PIL marks frombuffer images read-only,
+    # but buf is writable, so paste() may write through it
+    h, w = buf.shape[:2]
+    img = Image.frombuffer('RGBA', (w, h), buf, 'raw', 'RGBA', 0, 1)
+    img.readonly = 0
+    return img
+
+
+def open_image(src, size=None, max_pixels=None):
+    """Opens image bytes, a file object or a PIL image, resized to (size, size) if given.
+
+    Pixels are decoded lazily, as late as possible; images over max_pixels are
+    rejected from the header, before anything is decoded.
+    """
+    if isinstance(src, Image.Image):
+        img = src
+    else:
+        img = Image.open(io.BytesIO(src) if isinstance(src, (bytes, bytearray, memoryview)) else src)
+    if max_pixels and img.width * img.height > max_pixels:
+        raise ImageTooLarge(f'Image is {img.width}x{img.height}; the limit is {max_pixels} pixels')
+    if size is not None and img.format == 'JPEG':
+        # Lets libjpeg decode at a reduced DCT scale when the target is much smaller
+        # (a no-op once the pixels are loaded)
+        img.draft('RGB', (size, size))
+    if img.mode not in ('RGB', 'RGBA', 'RGBX', 'L'):
+        img = img.convert('RGB')
+    if size is not None and img.size != (size, size):
+        img = img.resize((size, size), Image.BILINEAR, reducing_gap=RESIZE_REDUCING_GAP)
+    return img
+
+
+def rgb_array(img):
+    """Read-only (H, W, 3) uint8 array of img that does not share the staging buffers."""
+    return np.asarray(img if img.mode == 'RGB' else img.convert('RGB'))
+
+
+def to_uint8_rgb(img):
+    """(H, W, 3) uint8 view of img's pixels in this thread's staging buffer."""
+    buf = _staging('decode', (img.height, img.width, 4))
+    _rgba_view(buf).paste(img)
+    return buf[..., :3]
+
+
+def to_tensor(img, out=None):
+    """(3, H, W) float32 tensor in [-1, 1], matching ToTensor + Normalize(0.5, 0.5)."""
+    import torch
+    rgb = torch.from_numpy(to_uint8_rgb(img)).permute(2, 0, 1)
+    if out is None:
+        out = torch.empty(rgb.shape, dtype=torch.float32)
+    # copy_ converts uint8 -> float32 on the fly; the rest is in place
+    return out.copy_(rgb).div_(127.5).sub_(1.0)
+
+
+def to_uint8(tensor):
+    """(H, W, C) contiguous uint8 array of a [-1, 1] (C, H, W) tensor, in this thread's staging buffers."""
+    import torch
+    c, h, w = tensor.shape
+    scratch = torch.from_numpy(_staging('denorm', (c, h, w), np.float32))
+    out = _staging('encode', (h, w, c))
+    # Same truncating conversion as ((t * 0.5 + 0.5).clamp(0, 1) * 255).astype(uint8)
+    torch.add(tensor.detach(), 1.0, out=scratch).mul_(127.5).clamp_(0, 255)
+    torch.from_numpy(out).copy_(scratch.permute(1, 2, 0))
+    return out
+
+
+def encode_png(arr, compress_level=None):
+    """PNG bytes of a contiguous (H, W, 3) uint8 array, as a BytesIO."""
+    h, w = arr.shape[:2]
+    img = Image.frombuffer('RGB', (w, h), np.ascontiguousarray(arr), 'raw', 'RGB', 0, 1)
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=PNG_COMPRESS_LEVEL if compress_level is None else compress_level)
+    return buf
+
+
+def png_data_url(arr):
+    return 'data:image/png;base64,' + base64.b64encode(encode_png(arr).getbuffer()).decode()
+
+
+def _legacy_roundtrip(data, size):
+    # The pre-image_io path: PIL -> torchvision -> tensor -> numpy -> PIL -> PNG
+    import torch
+    from torchvision import transforms
+    transform = transforms.Compose([transforms.Resize((size, size)), transforms.ToTensor(),
+                                    transforms.Normalize([0.5, 0.5, 0.5], [0.5, 0.5, 0.5])])
+    t = transform(Image.open(io.BytesIO(data)).convert('RGB'))
+    t = torch.clamp(t * 0.5 + 0.5, 0, 1)
+    arr = (t.cpu().detach().numpy().transpose(1, 2, 0) * 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format='PNG')
+    buf.seek(0)
+    return buf.read()
+
+
+def _roundtrip(data, size):
+    t = to_tensor(open_image(data, size))
+    return encode_png(to_uint8(t)).getbuffer()
+
+
+def _legacy_upload(data, size):
+    # Full decode at source resolution, then a plain resize
+    img = Image.open(io.BytesIO(data)).convert('RGB')
+    return np.asarray(img.resize((size, size), Image.BILINEAR))
+
+
+def _upload(data, size):
+    return to_uint8_rgb(open_image(data, size))
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ':'))
+
+
+def _upload_child(name, data, size, iters, results):
+    # Runs in a fresh process so the high-water mark only reflects this path
+    fn = {'legacy': _legacy_upload, 'image_io': _upload}[name]
+    before = _status_kb('VmRSS')
+    started = time.perf_counter()
+    for _ in range(iters):
+        fn(data, size)
+    elapsed = (time.perf_counter() - started) / iters
+    results.put({'ms_per_call': round(elapsed * 1000, 1),
+                 'peak_extra_mb': round((_status_kb('VmHWM') - before) / 1024, 1)})
+
+
+def _measure_upload(name, data, size, iters):
+    import multiprocessing as mp
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    child = ctx.Process(target=_upload_child, args=(name, data, size, iters, results))
+    child.start()
+    result = results.get()
+    child.join()
+    return result
+
+
+def _measure(fn, data, size, iters):
+    import tracemalloc
+    from torch.profiler import profile, ProfilerActivity
+
+    fn(data, size)
+    started = time.perf_counter()
+    for _ in range(iters):
+        fn(data, size)
+    elapsed = time.perf_counter() - started
+    # tracemalloc sees Python/NumPy allocations (not PIL's internal image memory);
+    # torch's allocator is counted by the profiler
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(iters, 20)):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(data, size)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn(data, size)
+    torch_allocs = [e for e in prof.events() if e.cpu_memory_usage > 0]
+    return {
+        'ms_per_call': round(elapsed / iters * 1000, 3),
+        'py_numpy_peak_kb': round(sum(peaks) / len(peaks) / 1024, 1),
+        'torch_allocs': len(torch_allocs),
+        'torch_alloc_kb': round(sum(e.cpu_memory_usage for e in torch_allocs) / 1024, 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-request allocations of the image decode/encode path')
+    parser.add_argument('--size', type=int, default=128)
+    parser.add_argument('--source-size', type=int, default=640)
+    parser.add_argument('--iters', type=int, default=200)
+    parser.add_argument('--upload-size', nargs=2, type=int, default=[6000, 4000], metavar=('W', 'H'),
+                        help='large photo for the upload decode comparison')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    src = Image.fromarray(rng.integers(0, 255, (args.source_size, args.source_size, 3), dtype=np.uint8))
+    for fmt in ('PNG', 'JPEG'):
+        raw = io.BytesIO()
+        src.save(raw, format=fmt)
+        data = raw.getvalue()
+        for name, fn in (('legacy', _legacy_roundtrip), ('image_io', _roundtrip)):
+            print(f"{fmt:>4} {name:>8}: {_measure(fn, data, args.size, args.iters)}")
+    # A large photo-sized upload reduced to the model size: full decode + resize vs. draft/reduce
+    w, h = args.upload_size
+    ramp = np.add.outer(np.linspace(0, 180, h, dtype=np.float32), np.linspace(0, 60, w, dtype=np.float32))
+    photo = Image.fromarray((ramp[..., None] + rng.integers(0, 40, (h, w, 3))).clip(0, 255).astype(np.uint8))
+    for fmt in ('JPEG', 'PNG'):
+        raw = io.BytesIO()
+        photo.save(raw, format=fmt)
+        for name in ('legacy', 'image_io'):
+            print(f"{w}x{h} {fmt:>4} upload {name:>8}: {_measure_upload(name, raw.getvalue(), args.size, 3)}")
+    del photo
+
+    # Smooth gradient plus mild noise, closer to a stego image than pure noise
+    ramp = np.linspace(0, 200, args.size, dtype=np.float32)
+    arr = (ramp[:, None, None] * 0.5 + ramp[None, :, None] * 0.25 + rng.normal(0, 4, (args.size, args.size, 3)))
+    arr = arr.clip(0, 255).astype(np.uint8)
+    for level in (0, 1, 6, 9):
+        started = time.perf_counter()
+        for _ in range(args.iters):
+            size = len(encode_png(arr, level).getbuffer())
+        print(f"png compress_level={level}: {(time.perf_counter() - started) / args.iters * 1000:.3f} ms, {size} bytes")
@@ -0,0 +1,308 @@
+"""Request and stage timings in the Prometheus text format, and a sampling profiler.
+
+Histograms are kept in-process and rendered by GET /metrics; point-in-time
+values (queue depths, cache and pool stats, startup timings) are read from
+collectors at scrape time. stage() times one step of a request into the
+stage histogram and, on request threads, into the response's Server-Timing
+header.
+
+The profiler samples every thread's stack at a fixed interval and returns
+collapsed stacks ("frame;frame;frame count" lines), the input format of
+flamegraph.pl, speedscope and inferno.
+
+    python backend/instrumentation.py --iters 200000
+"""
+import re
+import sys
+import time
+import bisect
+import argparse
+import threading
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def metric_name(*parts):
+    return _NAME_RE.sub('_', '_'.join(str(p) for p in parts if p != ''))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((k, (list(counts), total)) for k, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Named metrics plus collectors called at render time.
+
+    A collector returns an iterable of (name, documentation, type, value) tuples,
+    optionally followed by a sequence of (label, value) pairs. Samples sharing a
+    name are rendered as one metric.
+    """
+
+    def __init__(self, prefix='stegochat'):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(metric_name(self.prefix, name), documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(metric_name(self.prefix, name), documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        collected = {}
+        for collect in self._collectors:
+            for name, documentation, kind, value, *labels in collect():
+                name = metric_name(self.prefix, name)
+                if name not in collected:
+                    collected[name] = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+                collected[name].append(f'{name}{_labels((), (), labels[0] if labels else ())} {_number(value)}')
+        for samples in collected.values():
+            lines += samples
+        return '\n'.join(lines) + '\n'
+
+
+def flatten_stats(stats, documentation='Value from GET /stats', path=(), label_keys=None, labels=()):
+    """(name, documentation, 'gauge', value, labels) for every numeric leaf of a nested /stats dict.
+
+    label_keys maps a path to a label name: the keys of the dict found there
+    become values of that label instead of parts of the metric name, e.g.
+    {('models', 'versions'): 'version'}.
+    """
+    label_keys = label_keys or {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            label = label_keys.get(path + (key,))
+            if label is None:
+                yield from flatten_stats(value, documentation, path + (key,), label_keys, labels)
+            else:
+                for item, sub in value.items():
+                    if isinstance(sub, dict):
+                        yield from flatten_stats(sub, documentation, path + (key,), label_keys,
+                                                 labels + ((label, item),))
+        elif isinstance(value, bool):
+            yield metric_name(*path, key), documentation, 'gauge', int(value), labels
+        elif isinstance(value, (int, float)):
+            yield metric_name(*path, key), documentation, 'gauge', value, labels
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram('request_seconds', 'HTTP request latency (to the first byte of streamed bodies)',
+                                     ('route', 'method'))
+REQUESTS = REGISTRY.counter('requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+STAGE_SECONDS = REGISTRY.histogram('stage_seconds', 'Time spent in each encode/decode stage', ('stage',))
+MODEL_SECONDS = REGISTRY.histogram('model_seconds', 'Encoder/decoder call latency by model version and operation',
+                                   ('version', 'op'))
+
+_local = threading.local()
+
+
+def begin_request():
+    _local.timings = []
+
+
+def end_request():
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    return timings or []
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, name)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing(timings):
+    """Server-Timing header value; repeated stages are summed."""
+    totals = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ', '.join(f'{name};dur={elapsed * 1000:.2f}' for name, elapsed in totals.items())
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+# Innermost frames of threads parked on a lock, queue or socket; skipped unless include_idle
+IDLE_FRAMES = {('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('queue.py', 'get'),
+               ('selectors.py', 'select'), ('socket.py', 'accept'), ('socket.py', 'readinto'),
+               ('socketserver.py', 'serve_forever')}
+
+
+# One capture at a time per process, however many profiler instances exist
+_capture_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Samples all threads' Python stacks every interval seconds; one capture at a time per process."""
+
+    def __init__(self, interval=0.005, max_depth=64, include_idle=False):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.include_idle = include_idle
+
+    def _idle(self, frame):
+        code = frame.f_code
+        return (code.co_filename.rsplit('/', 1)[-1], code.co_name) in IDLE_FRAMES
+
+    def _collapse(self, frame, thread_name):
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
+
+    def capture(self, seconds, interval=None, include_idle=None):
+        """Blocks for seconds and returns a Counter of collapsed stacks; raises ProfilerBusy during another capture."""
+        interval = self.interval if interval is None else interval
+        include_idle = self.include_idle if include_idle is None else include_idle
+        if not _capture_lock.acquire(blocking=False):
+            raise ProfilerBusy('A profile is already being captured')
+        try:
+            stacks = _Tally()
+            me = threading.get_ident()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != me and (include_idle or not self._idle(frame)):
+                        stacks[self._collapse(frame, names.get(ident, f'thread-{ident}'))] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            _capture_lock.release()
+
+
+def format_collapsed(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Overhead of the instrumentation primitives')
+    parser.add_argument('--iters', type=int, default=200000)
+    args = parser.parse_args()
+
+    def per_call(fn):
+        started = time.perf_counter()
+        for _ in range(args.iters):
+            fn()
+        return (time.perf_counter() - started) / args.iters * 1e6
+
+    registry = Registry('bench')
+    hist = registry.histogram('h', 'bench', ('route',))
+    counter = registry.counter('c', 'bench', ('route',))
+    print(f"histogram.observe: {per_call(lambda: hist.observe(0.012, '/encode_message')):.3f} us")
+    print(f"counter.inc:       {per_call(lambda: counter.inc('/encode_message')):.3f} us")
+
+    def timed():
+        with stage('bench'):
+            pass
+    begin_request()
+    print(f"stage() on a request thread: {per_call(timed):.3f} us")
+    end_request()
+    print(f"stage() elsewhere:           {per_call(timed):.3f} us")
+
+    started = time.perf_counter()
+    text = REGISTRY.render()
+    print(f"render: {(time.perf_counter() - started) * 1000:.3f} ms, {len(text)} bytes")
+
+    # CPU-bound loop on a worker thread, sampled for a second
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            sum(i * i for i in range(1000))
+    worker = threading.Thread(target=spin, name='spin')
+    worker.start()
+    started = time.perf_counter()
+    stacks = SamplingProfiler(0.005).capture(1.0)
+    stop.set()
+    worker.join()
+    print(f"profiler: {sum(stacks.values())} samples in {time.perf_counter() - started:.2f}s; top stack:")
+    print(format_collapsed(stacks).splitlines()[0])
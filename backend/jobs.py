@@ -0,0 +1,128 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import QueueFull
+
+logger = logging.getLogger(__name__)
+
+
+class JobManager:
+    """Runs request pipelines on a bounded background executor.
+
+    The job function is called as fn(report, *args), where report(stage, progress)
+    records progress. Every state change is passed to on_update(job, event, meta),
+    with event being 'progress', 'complete' or 'failed' and meta the dict given at
+    submit time. Finished jobs stay pollable for ttl seconds, but only the
+    max_finished most recently used ones are kept, since results can carry
+    whole images.
+    """
+
+    def __init__(self, max_workers=4, max_pending=64, ttl=3600, on_update=None, max_finished=256):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.ttl = ttl
+        self.max_finished = max(1, int(max_finished))
+        self.on_update = on_update
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._finished = OrderedDict()  # job id -> None, least recently used first
+        self._active = 0
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'evicted': 0}
+
+    def submit(self, kind, fn, *args, meta=None):
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'queued',
+            'stage': 'queued',
+            'progress': 0.0,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'meta': meta or {},
+        }
+        with self._lock:
+            self._purge(now)
+            if self._active >= self.max_workers + self.max_pending:
+                self._stats['rejected'] += 1
+                raise QueueFull(f'Job queue is full ({self.max_pending} pending)')
+            self._active += 1
+            self._jobs[job['id']] = job
+            self._stats['submitted'] += 1
+            snap = self.snapshot(job)
+        self._executor.submit(self._run, job, fn, args)
+        return snap
+
+    def _purge(self, now):
+        expired = [jid for jid in self._finished if now - self._jobs[jid]['updated_at'] > self.ttl]
+        for jid in expired:
+            del self._finished[jid]
+            del self._jobs[jid]
+
+    def _update(self, job, event, **fields):
+        with self._lock:
+            job.update(fields, updated_at=time.time())
+            snap = self.snapshot(job)
+            if event != 'progress':
+                self._finished[job['id']] = None
+                while len(self._finished) > self.max_finished:
+                    del self._jobs[self._finished.popitem(last=False)[0]]
+                    self._stats['evicted'] += 1
+        if self.on_update is not None:
+            try:
+                self.on_update(snap, event, job['meta'])
+            except Exception as e:
+                logger.error(f"Job update hook failed: {e}")
+
+    def _run(self, job, fn, args):
+        def report(stage, progress):
+            self._update(job, 'progress', status='running', stage=stage, progress=round(progress, 3))
+
+        try:
+            report('started', 0.0)
+            result = fn(report, *args)
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            with self._lock:
+                self._active -= 1
+                self._stats['failed'] += 1
+            self._update(job, 'failed', status='error', error=str(e))
+            return
+        with self._lock:
+            self._active -= 1
+            self._stats['completed'] += 1
+        self._update(job, 'complete', status='done', stage='done', progress=1.0, result=result)
+
+    @staticmethod
+    def snapshot(job):
+        return {k: v for k, v in job.items() if k != 'meta'}
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job_id in self._finished:
+                self._finished.move_to_end(job_id)
+            return self.snapshot(job)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['active'] = self._active
+            s['tracked'] = len(self._jobs)
+            s['finished'] = len(self._finished)
+        s['max_workers'] = self.max_workers
+        s['max_pending'] = self.max_pending
+        s['max_finished'] = self.max_finished
+        return s
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
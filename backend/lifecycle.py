@@ -0,0 +1,211 @@
+"""Storage lifecycle: retention of derived images, orphan cleanup and compaction.
+
+Derived images (the 'attacked_*' copies written by /attack_image) are deleted
+once they are older than the retention period. Every other stored key should
+be referenced by a Message row; a key that is not, and is older than the grace
+period (a stego is stored a moment before its row is committed), is an orphan.
+Orphans are only reported unless orphan_action is 'delete'. Each pass ends by
+compacting the store (stale temp files of interrupted writes, empty shards).
+
+A pass walks the store in batches with a pause between them and checks each
+batch against the table with one indexed IN query, so it never holds the
+database or the interpreter for long. In dry-run mode nothing is deleted; the
+pass only counts and lists what would be.
+
+    python backend/lifecycle.py report
+    python backend/lifecycle.py run --delete-orphans
+"""
+import os
+import time
+import json
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+DERIVED_PREFIXES = ('attacked_',)
+ORPHAN_ACTIONS = ('report', 'delete')
+# The first pass waits for startup (model load, warm-up) to finish
+STARTUP_DELAY = 60
+MAX_CANDIDATES = 1000
+
+
+def is_derived(key):
+    return key.startswith(DERIVED_PREFIXES)
+
+
+def _tally():
+    return {'count': 0, 'bytes': 0}
+
+
+class StorageLifecycle:
+    """Periodic retention/orphan passes over a storage backend.
+
+    referenced(keys) returns the subset of keys that Message rows point at;
+    on_delete(key) runs after each deletion (derived caches, thumbnails).
+    """
+
+    def __init__(self, storage, referenced, retention=24 * 3600, orphan_grace=3600, orphan_action='report',
+                 batch_size=500, pause=0.05, interval=3600, dry_run=False, on_delete=None):
+        if orphan_action not in ORPHAN_ACTIONS:
+            raise ValueError(f"orphan_action must be one of {', '.join(ORPHAN_ACTIONS)}")
+        self.storage = storage
+        self.referenced = referenced
+        self.retention = retention
+        self.orphan_grace = orphan_grace
+        self.orphan_action = orphan_action
+        self.batch_size = max(1, int(batch_size))
+        self.pause = pause
+        self.interval = interval
+        self.dry_run = dry_run
+        self.on_delete = on_delete
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self._stats = {'passes': 0, 'running': False, 'deleted': _tally(), 'last_pass': {}}
+
+    def _delete(self, key):
+        if not self.storage.delete(key):
+            return False
+        if self.on_delete is not None:
+            self.on_delete(key)
+        return True
+
+    def _process(self, batch, now, summary, candidates):
+        unchecked = []
+        for entry in batch:
+            summary['keys'] += 1
+            summary['bytes'] += entry.size
+            age = now - entry.mtime
+            if is_derived(entry.key):
+                summary['derived']['count'] += 1
+                summary['derived']['bytes'] += entry.size
+                if age > self.retention:
+                    self._act(entry, 'expired', True, summary, candidates)
+            elif age > self.orphan_grace:
+                unchecked.append(entry)
+        if not unchecked:
+            return
+        referenced = self.referenced([e.key for e in unchecked])
+        for entry in unchecked:
+            if entry.key not in referenced:
+                self._act(entry, 'orphans', self.orphan_action == 'delete', summary, candidates)
+
+    def _act(self, entry, kind, delete, summary, candidates):
+        summary[kind]['count'] += 1
+        summary[kind]['bytes'] += entry.size
+        if len(candidates) < MAX_CANDIDATES:
+            candidates.append({'key': entry.key, 'kind': kind, 'bytes': entry.size,
+                               'age_hours': round((time.time() - entry.mtime) / 3600, 2)})
+        if delete and not self.dry_run and self._delete(entry.key):
+            summary['deleted']['count'] += 1
+            summary['deleted']['bytes'] += entry.size
+
+    def run_pass(self):
+        """One full pass over the store; returns (summary, candidates)."""
+        summary = {'keys': 0, 'bytes': 0, 'derived': _tally(), 'expired': _tally(), 'orphans': _tally(),
+                   'deleted': _tally(), 'compacted': 0, 'batches': 0, 'max_batch_ms': 0.0, 'dry_run': self.dry_run}
+        candidates = []
+        started = time.perf_counter()
+        with self._lock:
+            self._stats['running'] = True
+        try:
+            entries = self.storage.iter_entries()
+            while True:
+                batch_started = time.perf_counter()
+                batch = [e for _, e in zip(range(self.batch_size), entries)]
+                if not batch:
+                    break
+                self._process(batch, time.time(), summary, candidates)
+                summary['batches'] += 1
+                summary['max_batch_ms'] = max(summary['max_batch_ms'], (time.perf_counter() - batch_started) * 1000)
+                # Yield to request threads between batches; stop() interrupts the wait
+                if self._done.wait(self.pause):
+                    break
+            if not self.dry_run:
+                summary['compacted'] = self.storage.compact(self.orphan_grace)
+        finally:
+            summary['duration_s'] = round(time.perf_counter() - started, 3)
+            summary['max_batch_ms'] = round(summary['max_batch_ms'], 3)
+            with self._lock:
+                self._stats['running'] = False
+                self._stats['passes'] += 1
+                self._stats['last_pass'] = summary
+                self._stats['deleted']['count'] += summary['deleted']['count']
+                self._stats['deleted']['bytes'] += summary['deleted']['bytes']
+        return summary, candidates
+
+    def _loop(self):
+        if self._done.wait(min(STARTUP_DELAY, self.interval)):
+            return
+        while not self._done.is_set():
+            try:
+                summary, _ = self.run_pass()
+                logger.info(f"Storage lifecycle pass: {summary['keys']} keys, {summary['expired']['count']} expired, "
+                            f"{summary['orphans']['count']} orphans, {summary['deleted']['count']} deleted "
+                            f"({summary['deleted']['bytes']} bytes){' [dry run]' if self.dry_run else ''}")
+            except Exception as e:
+                logger.error(f"Storage lifecycle pass failed: {e}")
+            self._done.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='storage-lifecycle', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': self._thread is not None, 'dry_run': self.dry_run, 'passes': self._stats['passes'],
+                    'running': self._stats['running'], 'deleted': dict(self._stats['deleted']),
+                    # A finished pass's summary is never mutated again
+                    'last_pass': self._stats['last_pass']}
+
+
+if __name__ == '__main__':
+    from sqlalchemy import create_engine, select
+
+    from db_models import Message
+    from database import engine_options
+    from storage import create_storage
+    from thumbnails import ThumbnailCache
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Storage retention and orphan report/cleanup')
+    parser.add_argument('command', choices=['report', 'run'], help='report is a dry run; run deletes')
+    parser.add_argument('--url', default=os.environ.get('STEGO_DATABASE_URL') or
+                        f"sqlite:///{os.path.join(current_dir, 'stegochat.db')}")
+    parser.add_argument('--storage-dir', default=os.environ.get('STEGO_STORAGE_DIR', os.path.join(current_dir, 'storage')))
+    parser.add_argument('--thumb-dir', default=os.environ.get('STEGO_THUMB_DIR', os.path.join(current_dir, 'thumbnails')))
+    parser.add_argument('--retention-hours', type=float, default=float(os.environ.get('STEGO_DERIVED_RETENTION_HOURS', 24)))
+    parser.add_argument('--orphan-grace-hours', type=float, default=float(os.environ.get('STEGO_ORPHAN_GRACE_HOURS', 1)))
+    parser.add_argument('--delete-orphans', action='store_true', help='delete orphans too (default: report them)')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause-ms', type=float, default=0)
+    parser.add_argument('--list', type=int, default=20, help='candidates to print')
+    args = parser.parse_args()
+
+    engine = create_engine(args.url, **engine_options(args.url))
+    column = Message.__table__.c.stego_image_filename
+
+    def referenced(keys):
+        with engine.connect() as conn:
+            return set(conn.execute(select(column).where(column.in_(keys))).scalars())
+
+    thumbs = ThumbnailCache(args.thumb_dir, ())
+    lifecycle = StorageLifecycle(create_storage('local', args.storage_dir), referenced,
+                                 args.retention_hours * 3600, args.orphan_grace_hours * 3600,
+                                 'delete' if args.delete_orphans else 'report', args.batch_size,
+                                 args.pause_ms / 1000, dry_run=args.command == 'report', on_delete=thumbs.delete)
+    summary, candidates = lifecycle.run_pass()
+    for c in sorted(candidates, key=lambda c: -c['bytes'])[:args.list]:
+        print(f"{c['kind']:<8} {c['bytes']:>10}  {c['age_hours']:>8}h  {c['key']}")
+    print(json.dumps(summary, indent=2))
+    if summary['keys']:
+        print(f"scan: {summary['keys'] / max(summary['duration_s'], 1e-9):.0f} keys/s, "
+              f"longest batch {summary['max_batch_ms']} ms")
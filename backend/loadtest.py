@@ -0,0 +1,454 @@
+"""End-to-end load test: starts the backend, drives a traffic mix, reports latency and memory.
+
+The server runs as a subprocess on a free port with its own temporary database,
+storage, thumbnails and model versions, using the bundled checkpoints (or random
+weights with --weights random). Each concurrency level runs for --duration
+seconds; every client thread picks operations from the weighted --mix and sends
+synthetic images of the --sizes given. Per level the results file records
+throughput, p50/p95/p99 latency per operation and the peak RSS of the server
+process tree.
+--baseline exits with status 1 when a run regresses beyond --tolerance.
+
+    python backend/loadtest.py --mix encode=4 decode=3 messages=2 login=1 --concurrency 1 4 8 --out results.json
+    python backend/loadtest.py --concurrency 4 --save-baseline baseline.json
+    python backend/loadtest.py --concurrency 4 --baseline baseline.json --tolerance 0.2
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+
+import numpy as np
+from PIL import Image
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+OPERATIONS = ('register', 'login', 'encode', 'encode_tiled', 'encode_bulk', 'decode', 'attack', 'messages')
+DEFAULT_MIX = {'encode': 4, 'decode': 3, 'messages': 2, 'login': 1, 'attack': 1}
+ATTACKS = ('noise', 'blur', 'jpeg', 'crop')
+PASSWORD = 'loadtest-password'
+
+
+def parse_mix(items):
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}' (expected one of {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def synthetic_image(size, rng, fmt='PNG'):
+    # Gradient plus noise: compresses like a photo rather than like flat colour or pure noise
+    w, h = size
+    ramp = np.add.outer(np.linspace(0, 160, h), np.linspace(0, 80, w))[..., None]
+    arr = ramp + rng.normal(0, 12, (h, w, 3)) + rng.integers(0, 60, 3)
+    buf = io.BytesIO()
+    Image.fromarray(arr.clip(0, 255).astype(np.uint8)).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data, content_type) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, json_body=None, body=None, content_type=None):
+        """Returns (status, parsed JSON or raw bytes); connection failures are status 0."""
+        headers = {}
+        if json_body is not None:
+            body, content_type = json.dumps(json_body).encode(), 'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                status, data = resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            status, data = e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            return 0, None
+        try:
+            return status, json.loads(data)
+        except ValueError:
+            return status, data
+
+
+class Workload:
+    """Shared state of a run: registered users, stego images to decode/attack, request payloads."""
+
+    def __init__(self, client, sizes, tiled_sizes, encrypt_fraction, seed):
+        self.client = client
+        self.encrypt_fraction = encrypt_fraction
+        rng = np.random.default_rng(seed)
+        self.covers = [(synthetic_image((s, s), rng), 'image/png') for s in sizes]
+        self.covers += [(synthetic_image((s, s), rng, 'JPEG'), 'image/jpeg') for s in sizes]
+        self.tiled_covers = [(synthetic_image((s, s * 3 // 4), rng, 'JPEG'), 'image/jpeg') for s in tiled_sizes]
+        self.users = []
+        self.stegos = []
+        self._lock = threading.Lock()
+
+    def add_stego(self, url):
+        with self._lock:
+            self.stegos.append(url)
+            # Keep a bounded recent window; decodes of recent messages are the common case
+            del self.stegos[:-256]
+
+    def pick_stego(self, rng):
+        with self._lock:
+            return rng.choice(self.stegos) if self.stegos else None
+
+    def register(self, rng):
+        username = f'lt-{uuid.uuid4().hex[:12]}'
+        status, _ = self.client.request('POST', '/auth/register', {'username': username, 'password': PASSWORD})
+        if status == 200:
+            with self._lock:
+                self.users.append(username)
+        return status
+
+    def login(self, rng):
+        return self.client.request('POST', '/auth/login', {'username': rng.choice(self.users), 'password': PASSWORD})[0]
+
+    def _encode(self, rng, covers, tiled):
+        cover, content_type = rng.choice(covers)
+        fields = {'secret_text': f'load test {rng.random():.8f}', 'sender': rng.choice(self.users),
+                  'receiver': rng.choice(self.users + ['Global'])}
+        if rng.random() < self.encrypt_fraction:
+            fields['password'] = PASSWORD
+        if tiled:
+            fields['tiled'] = '1'
+        body, ctype = multipart(fields, {'cover_image': ('cover', cover, content_type)})
+        status, data = self.client.request('POST', '/encode_message', body=body, content_type=ctype)
+        if status == 200 and not tiled:
+            self.add_stego(data['stego_image'])
+        return status
+
+    def encode(self, rng):
+        return self._encode(rng, self.covers, False)
+
+    def encode_tiled(self, rng):
+        return self._encode(rng, self.tiled_covers, True)
+
+    def encode_bulk(self, rng):
+        body = {'secret_text': f'load test {rng.random():.8f}', 'sender': rng.choice(self.users),
+                'receivers': rng.sample(self.users, min(8, len(self.users)))}
+        if rng.random() < self.encrypt_fraction:
+            body['password'] = PASSWORD
+        status, data = self.client.request('POST', '/encode_bulk', body)
+        if status == 200:
+            for message in data['messages']:
+                self.add_stego(message['stego_image'])
+        return status
+
+    def decode(self, rng):
+        return self.client.request('POST', '/decode_message', {'stego_image': self.pick_stego(rng)})[0]
+
+    def attack(self, rng):
+        body = {'stego_image': self.pick_stego(rng), 'attack_type': rng.choice(ATTACKS)}
+        return self.client.request('POST', '/attack_image', body)[0]
+
+    def messages(self, rng):
+        if rng.random() < 0.5:
+            user, peer = rng.sample(self.users, 2)
+            return self.client.request('GET', f'/messages?limit=50&user={user}&peer={peer}')[0]
+        return self.client.request('GET', '/messages?limit=50')[0]
+
+    def prepare(self, users, messages, rng):
+        for _ in range(users):
+            self.register(rng)
+        if len(self.users) < 2:
+            raise RuntimeError('Could not register load-test users')
+        for _ in range(messages):
+            self.encode(rng)
+        if not self.stegos:
+            raise RuntimeError('Could not encode seed messages')
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def _status_kb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_mb(pid):
+    """RSS of pid and all its descendants (model worker processes included); Linux only."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += _status_kb(p, 'VmRSS')
+        stack.extend(_children(p))
+    return total / 1024.0
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.peak_mb = 0.0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self.pid))
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return round(self.peak_mb, 1)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(samples, elapsed):
+    ok = [s for s in samples if 200 <= s[1] < 300]
+    ops = {}
+    for name in sorted({s[0] for s in samples}):
+        mine = [s for s in samples if s[0] == name]
+        lat = sorted(s[2] * 1000 for s in mine if 200 <= s[1] < 300)
+        statuses = {}
+        for s in mine:
+            statuses[str(s[1])] = statuses.get(str(s[1]), 0) + 1
+        ops[name] = {'count': len(mine), 'ok': len(lat), 'rps': round(len(lat) / elapsed, 2),
+                     'error_rate': round(1 - len(lat) / len(mine), 4), 'statuses': statuses,
+                     'mean_ms': round(sum(lat) / len(lat), 2) if lat else None,
+                     **{f'p{q}_ms': round(percentile(lat, q / 100), 2) if lat else None for q in (50, 95, 99)}}
+    lat = sorted(s[2] * 1000 for s in ok)
+    return {'requests': len(samples), 'ok': len(ok), 'throughput_rps': round(len(ok) / elapsed, 2),
+            'error_rate': round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+            **{f'p{q}_ms': round(percentile(lat, q / 100), 2) if lat else None for q in (50, 95, 99)},
+            'ops': ops}
+
+
+def run_level(workload, mix, concurrency, duration, seed):
+    names, weights = list(mix), list(mix.values())
+    samples, lock = [], threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        mine = []
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            status = getattr(workload, name)(rng)
+            mine.append((name, status, time.perf_counter() - started))
+        with lock:
+            samples.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(samples, time.perf_counter() - started)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, weights, extra_env, startup_timeout):
+    port = free_port()
+    env = dict(os.environ, STEGO_HOST='127.0.0.1', STEGO_PORT=str(port), STEGO_DEBUG='0',
+               STEGO_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+               STEGO_STORAGE_DIR=os.path.join(workdir, 'storage'), STEGO_THUMB_DIR=os.path.join(workdir, 'thumbs'),
+               STEGO_MODEL_DIR=os.path.join(workdir, 'versions'))
+    if weights == 'random':
+        env['STEGO_CHECKPOINT_DIR'] = os.path.join(workdir, 'no-checkpoints')
+    env.update(extra_env)
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    proc = subprocess.Popen([sys.executable, os.path.join(CURRENT_DIR, 'server.py')], env=env,
+                            stdout=log, stderr=subprocess.STDOUT, cwd=CURRENT_DIR)
+    client = Client(f'http://127.0.0.1:{port}')
+    started = time.perf_counter()
+    while time.perf_counter() - started < startup_timeout:
+        if proc.poll() is not None:
+            break
+        if client.request('GET', '/health')[0] == 200:
+            return proc, client, time.perf_counter() - started
+        time.sleep(0.25)
+    stop_server(proc)
+    log.close()
+    with open(os.path.join(workdir, 'server.log'), 'rb') as f:
+        tail = f.read()[-4000:].decode(errors='replace')
+    raise RuntimeError(f'Server did not become ready:\n{tail}')
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def compare(results, baseline, tolerance, min_delta_ms=5.0):
+    """Regressions of results against baseline, matched by concurrency level and operation."""
+    regressions = []
+    base_levels = {level['concurrency']: level for level in baseline.get('levels', [])}
+    for level in results['levels']:
+        base = base_levels.get(level['concurrency'])
+        if base is None:
+            continue
+        where = f"concurrency {level['concurrency']}"
+        if level['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{where}: throughput {level['throughput_rps']} < baseline {base['throughput_rps']} rps")
+        base_mem, mem = base.get('peak_rss_mb'), level.get('peak_rss_mb')
+        if base_mem and mem and mem > base_mem * (1 + tolerance):
+            regressions.append(f"{where}: peak RSS {mem} MB > baseline {base_mem} MB")
+        for name, op in level['ops'].items():
+            base_op = base['ops'].get(name)
+            if base_op is None:
+                continue
+            if op['error_rate'] > base_op['error_rate'] + 0.01:
+                regressions.append(f"{where} {name}: error rate {op['error_rate']} > baseline {base_op['error_rate']}")
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                now, before = op.get(key), base_op.get(key)
+                if now is not None and before is not None and now > before * (1 + tolerance) and now - before > min_delta_ms:
+                    regressions.append(f"{where} {name}: {key} {now} > baseline {before}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CURRENT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='StegoChat end-to-end load test')
+    parser.add_argument('--mix', nargs='+', default=[f'{k}={v}' for k, v in DEFAULT_MIX.items()],
+                        help=f"operation=weight pairs; operations: {', '.join(OPERATIONS)}")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 8])
+    parser.add_argument('--duration', type=float, default=20, help='seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=3, help='untimed seconds of traffic before the first level')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[64, 128, 256, 512], help='cover image sides')
+    parser.add_argument('--tiled-sizes', nargs='+', type=int, default=[512, 1024], help='cover widths for encode_tiled')
+    parser.add_argument('--encrypt-fraction', type=float, default=0.25, help='share of encodes with a password')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--seed-messages', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--weights', choices=['bundled', 'random'], default='bundled')
+    parser.add_argument('--env', nargs='*', default=[], help='KEY=VALUE settings for the server, e.g. STEGO_WORKERS=2')
+    parser.add_argument('--url', default=None, help='test an already running server instead of starting one')
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--out', default='loadtest_results.json')
+    parser.add_argument('--baseline', default=None, help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--save-baseline', default=None, help='also write the results here')
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    extra_env = dict(item.split('=', 1) for item in args.env)
+    workdir = tempfile.mkdtemp(prefix='stego-loadtest-')
+    proc, startup = None, None
+    if args.url:
+        client = Client(args.url)
+    else:
+        proc, client, startup = start_server(workdir, args.weights, extra_env, args.startup_timeout)
+        print(f"Server ready in {startup:.1f}s (pid {proc.pid}, logs in {workdir})")
+
+    try:
+        workload = Workload(client, args.sizes, args.tiled_sizes, args.encrypt_fraction, args.seed)
+        workload.prepare(args.users, args.seed_messages, random.Random(args.seed))
+        if args.warmup > 0:
+            run_level(workload, mix, max(args.concurrency), args.warmup, args.seed)
+        levels = []
+        for concurrency in args.concurrency:
+            sampler = MemorySampler(proc.pid) if proc else None
+            if sampler:
+                sampler.start()
+            level = {'concurrency': concurrency, 'duration_s': args.duration}
+            level.update(run_level(workload, mix, concurrency, args.duration, args.seed + concurrency))
+            level['peak_rss_mb'] = sampler.stop() if sampler else None
+            status, stats = client.request('GET', '/stats')
+            if status == 200:
+                # Encode/decode batchers belong to each loaded model version
+                versions = (stats.get('models') or {}).get('versions') or {}
+                level['server'] = {'batching': {name: v.get('batching') for name, v in versions.items()},
+                                   'cache': stats.get('cache')}
+            levels.append(level)
+            print(f"concurrency {concurrency:>3}: {level['throughput_rps']:>8.2f} req/s  p50 {level['p50_ms']} ms  "
+                  f"p95 {level['p95_ms']} ms  p99 {level['p99_ms']} ms  errors {level['error_rate']:.2%}  "
+                  f"peak RSS {level['peak_rss_mb']} MB")
+            for name, op in level['ops'].items():
+                print(f"    {name:<13} {op['count']:>6}  p50 {op['p50_ms']}  p95 {op['p95_ms']}  p99 {op['p99_ms']}  "
+                      f"statuses {op['statuses']}")
+        results = {
+            'meta': {'commit': _git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'python': platform.python_version(), 'platform': platform.platform(),
+                     'cpus': os.cpu_count(), 'mix': mix, 'sizes': args.sizes, 'weights': args.weights,
+                     'server_env': extra_env, 'url': args.url},
+            'server': {'startup_s': round(startup, 2) if startup else None,
+                       'vm_hwm_mb': round(_status_kb(proc.pid, 'VmHWM') / 1024.0, 1) if proc else None},
+            'levels': levels,
+        }
+    finally:
+        if proc:
+            stop_server(proc)
+
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
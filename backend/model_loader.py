@@ -0,0 +1,101 @@
+import os
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_REPO_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'model_repo')
+# Bundled checkpoints; point STEGO_CHECKPOINT_DIR elsewhere (e.g. an empty dir for random weights)
+CHECKPOINT_DIR = os.environ.get('STEGO_CHECKPOINT_DIR', os.path.join(MODEL_REPO_DIR, 'outputs', 'checkpoints'))
+# Published model versions, one checkpoint directory each (see model_registry.py)
+MODEL_DIR = os.environ.get('STEGO_MODEL_DIR', os.path.join(MODEL_REPO_DIR, 'outputs', 'versions'))
+
+if MODEL_REPO_DIR not in sys.path:
+    sys.path.insert(0, MODEL_REPO_DIR)
+
+
+def load_state_dicts(checkpoint_dir=CHECKPOINT_DIR):
+    """Returns (encoder_state, decoder_state), or (None, None) if unavailable."""
+    import torch
+    encoder_path = os.path.join(checkpoint_dir, 'encoder_final.pth')
+    decoder_path = os.path.join(checkpoint_dir, 'decoder_final.pth')
+    if not (os.path.exists(encoder_path) and os.path.exists(decoder_path)):
+        logger.warning(f"Weights not found. Using random weights.")
+        return None, None
+    try:
+        return (torch.load(encoder_path, map_location='cpu'),
+                torch.load(decoder_path, map_location='cpu'))
+    except Exception:
+        logger.warning("Using random weights.")
+        return None, None
+
+
+def share_state_dict(state):
+    # Moves tensors into shared memory so worker processes can map them read-only
+    if state is not None:
+        for t in state.values():
+            t.share_memory_()
+    return state
+
+
+def build_models(device, encoder_state=None, decoder_state=None, assign=False):
+    from models.encoder import StegoEncoder
+    from models.decoder import StegoDecoder
+    encoder = StegoEncoder(input_channels=6, hidden_dim=64).to(device)
+    decoder = StegoDecoder(input_channels=3, hidden_dim=64).to(device)
+    if encoder_state is not None and decoder_state is not None:
+        try:
+            # assign=True keeps the given tensors (e.g. shared memory) instead of copying them
+            encoder.load_state_dict(encoder_state, assign=assign)
+            decoder.load_state_dict(decoder_state, assign=assign)
+        except Exception:
+            logger.warning("Using random weights.")
+    encoder.eval()
+    decoder.eval()
+    return encoder, decoder
+
+
+def scripted_paths(checkpoint_dir=CHECKPOINT_DIR):
+    return (os.path.join(checkpoint_dir, 'encoder_final.torchscript.pt'),
+            os.path.join(checkpoint_dir, 'decoder_final.torchscript.pt'))
+
+
+def _artifact_is_fresh(artifact, source):
+    if not os.path.exists(artifact):
+        return False
+    # A TorchScript file older than its checkpoint would silently serve stale weights
+    return not os.path.exists(source) or os.path.getmtime(artifact) >= os.path.getmtime(source)
+
+
+def scripted_available(checkpoint_dir=CHECKPOINT_DIR):
+    encoder_ts, decoder_ts = scripted_paths(checkpoint_dir)
+    return (_artifact_is_fresh(encoder_ts, os.path.join(checkpoint_dir, 'encoder_final.pth')) and
+            _artifact_is_fresh(decoder_ts, os.path.join(checkpoint_dir, 'decoder_final.pth')))
+
+
+def load_scripted_models(device, checkpoint_dir=CHECKPOINT_DIR):
+    """Loads exported TorchScript artifacts, or returns None if missing or stale."""
+    import torch
+    if not scripted_available(checkpoint_dir):
+        return None
+    encoder_ts, decoder_ts = scripted_paths(checkpoint_dir)
+    try:
+        encoder = torch.jit.load(encoder_ts, map_location=device)
+        decoder = torch.jit.load(decoder_ts, map_location=device)
+    except Exception as e:
+        logger.warning(f"Could not load TorchScript artifacts ({e}), falling back to checkpoints.")
+        return None
+    encoder.eval()
+    decoder.eval()
+    return encoder, decoder
+
+
+def load_models(device, checkpoint_dir=CHECKPOINT_DIR, prefer_scripted=True):
+    if prefer_scripted:
+        models = load_scripted_models(device, checkpoint_dir)
+        if models is not None:
+            logger.info("Loaded TorchScript model artifacts.")
+            return models
+    encoder_state, decoder_state = load_state_dicts(checkpoint_dir)
+    return build_models(device, encoder_state, decoder_state)
@@ -0,0 +1,403 @@
+"""Versioned encoder/decoder pairs: background loading, atomic swaps and A/B routing.
+
+A model version is a directory holding encoder_final.pth and decoder_final.pth
+(and optionally their TorchScript exports). 'default' is the bundled checkpoint
+directory; every other version is a subdirectory of the model directory, put
+there by `publish` and never changed afterwards: messages record the version
+that encoded them, and are decoded by the same one.
+
+New encodes go to the active version, or to the candidate for a share of
+senders (hashed, so one sender stays on one side of the experiment). Activating
+a version swaps a single reference; requests already running finish on the
+version they started with, and a replaced version stays loaded, since decodes
+of its messages still need it, until it is unloaded explicitly.
+
+    python backend/model_registry.py publish v2 --from model_repo/outputs/checkpoints
+    python backend/model_registry.py list
+"""
+import os
+import re
+import time
+import zlib
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+from batching import MicroBatcher
+from instrumentation import MODEL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = 'default'
+CHECKPOINT_FILES = ('encoder_final.pth', 'decoder_final.pth')
+ARTIFACT_FILES = CHECKPOINT_FILES + ('encoder_final.torchscript.pt', 'decoder_final.torchscript.pt')
+# Also keeps staging directories ('.tmp-...') out of the catalog
+_NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+# Unloading waits this long for requests still running on the version
+DRAIN_TIMEOUT = 30.0
+
+
+class UnknownVersion(LookupError):
+    pass
+
+
+def validate_name(name):
+    if not isinstance(name, str) or not _NAME_RE.match(name):
+        raise ValueError(f'Invalid model version name: {name!r}')
+    return name
+
+
+def is_complete(directory):
+    return all(os.path.isfile(os.path.join(directory, f)) for f in CHECKPOINT_FILES)
+
+
+def _tally():
+    return {'count': 0, 'total': 0.0, 'max': 0.0}
+
+
+class ModelVersion:
+    """One loaded encoder/decoder pair with its own micro-batchers and metrics.
+
+    encode_forward/decode_forward run a batched forward pass: on a worker pool
+    of the version's own, or on in-process modules. on_close, if given, is
+    called once the version is drained and closed, e.g. to stop that pool.
+    """
+
+    def __init__(self, name, checkpoint_dir, encode_forward, decode_forward, batch_options=(), num_runners=1,
+                 info=None, on_close=None):
+        self.name = name
+        self.checkpoint_dir = checkpoint_dir
+        self.info = dict(info or {}, loaded_at=round(time.time(), 3))
+        self._encode_forward = encode_forward
+        self._decode_forward = decode_forward
+        self._on_close = on_close
+        self.encode_batcher = MicroBatcher(f'encode-{name}', encode_forward, *batch_options, num_runners=num_runners)
+        self.decode_batcher = MicroBatcher(f'decode-{name}', decode_forward, *batch_options, num_runners=num_runners)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._inflight = 0
+        self._routed = 0
+        self._latency = {}
+        self._quality = {'scored': 0, 'psnr_total': 0.0, 'ssim_total': 0.0,
+                         'payloads': 0, 'payload_failures': 0, 'corrected_bits': 0}
+
+    @contextmanager
+    def _call(self, op):
+        with self._lock:
+            self._inflight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                self._inflight -= 1
+                self._idle.notify_all()
+            raise
+        seconds = time.perf_counter() - started
+        MODEL_SECONDS.observe(seconds, self.name, op)
+        with self._lock:
+            self._inflight -= 1
+            self._idle.notify_all()
+            tally = self._latency.setdefault(op, _tally())
+            tally['count'] += 1
+            tally['total'] += seconds
+            tally['max'] = max(tally['max'], seconds)
+
+    # Single items, through this version's micro-batchers
+    def encode(self, cover_t, secret_t, timeout=None):
+        with self._call('encode'):
+            return self.encode_batcher.run(cover_t, secret_t, timeout=timeout)
+
+    def decode(self, stego_t, timeout=None):
+        with self._call('decode'):
+            return self.decode_batcher.run(stego_t, timeout=timeout)
+
+    # Whole batches (tiles, bulk encodes, robustness sweeps), straight to the forward pass
+    def run_encoder(self, cover_batch, secret_batch):
+        with self._call('encode_batch'):
+            return self._encode_forward(cover_batch, secret_batch)
+
+    def run_decoder(self, stego_batch):
+        with self._call('decode_batch'):
+            return self._decode_forward(stego_batch)
+
+    def count_routed(self):
+        with self._lock:
+            self._routed += 1
+
+    def record_quality(self, metrics):
+        """Cover/stego scores of one encode (quality.as_dict)."""
+        with self._lock:
+            self._quality['scored'] += 1
+            self._quality['psnr_total'] += metrics['psnr']
+            self._quality['ssim_total'] += metrics['ssim']
+
+    def record_payload(self, ok, corrected_bits=0):
+        """Outcome of reading one binary payload back from a decode."""
+        with self._lock:
+            self._quality['payloads'] += 1
+            self._quality['payload_failures'] += int(not ok)
+            self._quality['corrected_bits'] += corrected_bits
+
+    def close(self, timeout=DRAIN_TIMEOUT):
+        with self._lock:
+            if not self._idle.wait_for(lambda: not self._inflight, timeout):
+                logger.warning(f"Model version '{self.name}' closed with {self._inflight} calls still running")
+        self.encode_batcher.close()
+        self.decode_batcher.close()
+        if self._on_close is not None:
+            self._on_close()
+
+    def stats(self):
+        with self._lock:
+            latency = {op: dict(t) for op, t in self._latency.items()}
+            q = dict(self._quality)
+            inflight, routed = self._inflight, self._routed
+        scored, payloads = q['scored'], q['payloads']
+        return dict(self.info, checkpoint_dir=self.checkpoint_dir, inflight=inflight, routed=routed,
+                    latency={op: {'count': t['count'], 'avg_ms': round(t['total'] / t['count'] * 1000.0, 3),
+                                  'max_ms': round(t['max'] * 1000.0, 3)} for op, t in latency.items()},
+                    quality={'scored': scored,
+                             'avg_psnr': round(q['psnr_total'] / scored, 2) if scored else None,
+                             'avg_ssim': round(q['ssim_total'] / scored, 4) if scored else None,
+                             'payloads': payloads,
+                             'payload_failure_rate': round(q['payload_failures'] / payloads, 4) if payloads else None,
+                             'avg_corrected_bits': round(q['corrected_bits'] / payloads, 2) if payloads else None},
+                    batching={'encode': self.encode_batcher.stats(), 'decode': self.decode_batcher.stats()})
+
+
+class ModelRegistry:
+    """Loaded model versions, the one serving new encodes and an optional A/B candidate.
+
+    load_version(name, checkpoint_dir) builds and warms up a ModelVersion. It
+    runs on a background thread for load(), and get() waits for it when asked
+    for a version that is on disk but not loaded yet. With watch_interval set,
+    versions published after startup are loaded as soon as they appear.
+    """
+
+    def __init__(self, model_dir, default_dir, load_version, watch_interval=0):
+        self.model_dir = model_dir
+        self.default_dir = default_dir
+        self.watch_interval = watch_interval
+        self._load_version = load_version
+        self._versions = {}
+        self._loading = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+        # (active, candidate, share): replaced as a whole, so readers never need the lock
+        self._routing = (None, None, 0.0)
+        self._swaps = 0
+        self._done = threading.Event()
+        self._watcher = None
+
+    def locate(self, name):
+        """Checkpoint directory of a version; raises UnknownVersion if it isn't on disk."""
+        validate_name(name)
+        if name == DEFAULT_VERSION:
+            # Missing bundled checkpoints mean random weights, as before versions existed
+            return self.default_dir
+        directory = os.path.join(self.model_dir, name)
+        if not is_complete(directory):
+            raise UnknownVersion(f"Model version '{name}' not found")
+        return directory
+
+    def catalog(self):
+        """Names of the versions on disk, loaded or not."""
+        try:
+            entries = sorted(os.listdir(self.model_dir))
+        except FileNotFoundError:
+            entries = []
+        return [DEFAULT_VERSION] + [n for n in entries if n != DEFAULT_VERSION and _NAME_RE.match(n)
+                                    and is_complete(os.path.join(self.model_dir, n))]
+
+    def names(self):
+        return list(self._versions)
+
+    def add(self, version):
+        with self._lock:
+            self._versions[version.name] = version
+        return version
+
+    def load(self, name):
+        """Future of the loaded ModelVersion; a version not loaded yet loads on a background thread."""
+        with self._lock:
+            if name in self._versions:
+                future = Future()
+                future.set_result(self._versions[name])
+                return future
+            if name in self._loading:
+                return self._loading[name]
+            checkpoint_dir = self.locate(name)
+            future = self._loading[name] = Future()
+        threading.Thread(target=self._load, args=(name, checkpoint_dir, future), name=f'model-load-{name}',
+                         daemon=True).start()
+        return future
+
+    def _load(self, name, checkpoint_dir, future):
+        started = time.perf_counter()
+        try:
+            version = self._load_version(name, checkpoint_dir)
+        except Exception as e:
+            logger.error(f"Loading model version '{name}' failed: {e}")
+            with self._lock:
+                del self._loading[name]
+                self._failed[name] = str(e)
+            future.set_exception(e)
+            return
+        version.info['load_seconds'] = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self._versions[name] = version
+            del self._loading[name]
+            self._failed.pop(name, None)
+        logger.info(f"Model version '{name}' loaded from {checkpoint_dir} in {version.info['load_seconds']}s")
+        future.set_result(version)
+
+    def get(self, name, timeout=None):
+        """The loaded version, loading it first (and waiting) if it is only on disk."""
+        version = self._versions.get(name)
+        if version is not None:
+            return version
+        return self.load(name).result(timeout)
+
+    @property
+    def active(self):
+        return self._routing[0]
+
+    def activate(self, name, timeout=None):
+        version = self.get(name, timeout)
+        with self._lock:
+            previous, candidate, share = self._routing
+            if candidate is version:
+                # Promoting the candidate ends the experiment
+                candidate, share = None, 0.0
+            self._routing = (version, candidate, share)
+            self._swaps += 1
+        logger.info(f"Model version '{name}' is now active" + (f" (was '{previous.name}')" if previous else ''))
+        return version
+
+    def set_candidate(self, name, share, timeout=None):
+        """Sends share (0..1) of senders to version name; name None ends the experiment."""
+        share = float(share)
+        if not 0.0 <= share <= 1.0:
+            raise ValueError('share must be between 0 and 1')
+        version = self.get(name, timeout) if name is not None else None
+        with self._lock:
+            active = self._routing[0]
+            if version is not None and version is active:
+                raise ValueError(f"Model version '{name}' is already active")
+            self._routing = (active, version, share if version is not None else 0.0)
+        logger.info(f"Model candidate: '{name}' at {share:.0%}" if name else 'Model candidate cleared')
+        return version
+
+    def route(self, key=None):
+        """The version that encodes for key (a sender): the candidate for its share of keys, else the active one."""
+        version, candidate, share = self._routing
+        if candidate is not None and share > 0:
+            bucket = zlib.crc32(key.encode()) % 10000 if key is not None else random.randrange(10000)
+            if bucket < share * 10000:
+                version = candidate
+        version.count_routed()
+        return version
+
+    def unload(self, name, timeout=DRAIN_TIMEOUT):
+        with self._lock:
+            active, candidate, _ = self._routing
+            if any(v is not None and v.name == name for v in (active, candidate)):
+                raise ValueError(f"Model version '{name}' is serving encodes; activate or clear it first")
+            version = self._versions.pop(name, None)
+        if version is None:
+            raise UnknownVersion(f"Model version '{name}' is not loaded")
+        # New lookups no longer find it; let the calls already running finish
+        version.close(timeout)
+        logger.info(f"Model version '{name}' unloaded")
+        return version
+
+    def _watch(self):
+        known = set(self.catalog())
+        while not self._done.wait(self.watch_interval):
+            try:
+                for name in self.catalog():
+                    if name not in known:
+                        known.add(name)
+                        logger.info(f"New model version '{name}' found, loading it in the background")
+                        self.load(name)
+            except Exception as e:
+                logger.error(f"Model directory scan failed: {e}")
+
+    def start(self):
+        if self._watcher is None and self.watch_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name='model-watch', daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._done.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        with self._lock:
+            versions = list(self._versions.values())
+        for version in versions:
+            version.close(timeout=5.0)
+
+    def stats(self):
+        active, candidate, share = self._routing
+        with self._lock:
+            versions = dict(self._versions)
+            loading, failed, swaps = sorted(self._loading), dict(self._failed), self._swaps
+        return {'active': active.name if active else None, 'candidate': candidate.name if candidate else None,
+                'candidate_share': share, 'swaps': swaps, 'watching': self._watcher is not None,
+                'available': self.catalog(), 'loading': loading, 'failed': failed,
+                'versions': {name: v.stats() for name, v in versions.items()}}
+
+
+def publish(model_dir, name, source):
+    """Copies the checkpoints in source to model_dir/name; the version appears all at once or not at all."""
+    validate_name(name)
+    if name == DEFAULT_VERSION:
+        raise ValueError(f"'{DEFAULT_VERSION}' is the bundled checkpoint directory")
+    if not is_complete(source):
+        raise ValueError(f"{source} needs {' and '.join(CHECKPOINT_FILES)}")
+    target = os.path.join(model_dir, name)
+    if os.path.exists(target):
+        raise ValueError(f"Model version '{name}' already exists; published versions are immutable")
+    os.makedirs(model_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=model_dir, prefix='.tmp-')
+    try:
+        for f in ARTIFACT_FILES:
+            if os.path.isfile(os.path.join(source, f)):
+                # copy2 keeps mtimes, which the TorchScript freshness check compares
+                shutil.copy2(os.path.join(source, f), os.path.join(staging, f))
+        os.chmod(staging, 0o755)
+        os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+if __name__ == '__main__':
+    from model_loader import CHECKPOINT_DIR, MODEL_DIR
+
+    parser = argparse.ArgumentParser(description='Publish and list model versions')
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_cmd = commands.add_parser('publish', help='copy a checkpoint directory in as a new version')
+    publish_cmd.add_argument('name')
+    publish_cmd.add_argument('--from', dest='source', default=CHECKPOINT_DIR)
+    commands.add_parser('list', help='versions on disk')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        print(f'Published {args.name} to {publish(args.model_dir, args.name, args.source)}')
+    else:
+        registry = ModelRegistry(args.model_dir, CHECKPOINT_DIR, load_version=None)
+        for name in registry.catalog():
+            directory = registry.locate(name)
+            files = [f for f in ARTIFACT_FILES if os.path.isfile(os.path.join(directory, f))]
+            size = sum(os.path.getsize(os.path.join(directory, f)) for f in files)
+            print(f"{name:<24} {size / 1e6:8.1f} MB  {'torchscript' if len(files) == len(ARTIFACT_FILES) else 'eager':<11}  "
+                  f"{directory}")
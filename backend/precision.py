@@ -0,0 +1,165 @@
+"""Reduced-precision CPU inference modes and the accuracy guard that gates them.
+
+A mode is only used if, on a fixed image set, the stego-vs-cover PSNR and the
+recovered-secret PSNR both stay within a tolerance of the fp32 baseline.
+
+    python backend/precision.py --mode bf16 --channels-last --tolerance-db 0.5
+"""
+import os
+import copy
+import logging
+import argparse
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+MODES = ('fp32', 'int8', 'bf16')
+
+
+def cpu_supports_bf16():
+    # Native bf16 needs AVX512-BF16 or AMX; elsewhere it is emulated and slower than fp32
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+class PrecisionWrapper(nn.Module):
+    def __init__(self, model, autocast_dtype=None, channels_last=False):
+        super().__init__()
+        self.model = model
+        self.autocast_dtype = autocast_dtype
+        self.channels_last = channels_last
+
+    def forward(self, *inputs):
+        if self.channels_last:
+            inputs = [x.contiguous(memory_format=torch.channels_last) for x in inputs]
+        if self.autocast_dtype is None:
+            out = self.model(*inputs)
+        else:
+            with torch.autocast('cpu', dtype=self.autocast_dtype):
+                out = self.model(*inputs)
+        # Callers always get contiguous fp32 back, whatever ran inside
+        return out.float().contiguous()
+
+
+def apply_precision(model, mode='fp32', channels_last=False):
+    if mode not in MODES:
+        raise ValueError(f"Unknown precision mode '{mode}' (expected one of {', '.join(MODES)})")
+    model = copy.deepcopy(model)
+    autocast_dtype = None
+    if mode == 'int8':
+        # Dynamic quantization only covers Linear/recurrent layers; convolutions stay fp32
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        quantized = sum(1 for m in model.modules() if type(m).__module__.startswith('torch.ao.nn.quantized'))
+        if not quantized:
+            # It would run fp32 and pass the guard against itself; refuse rather than report int8
+            raise ValueError(f"int8: {type(model).__name__} has no Linear layers, dynamic quantization "
+                             'would leave it entirely fp32')
+    elif mode == 'bf16':
+        autocast_dtype = torch.bfloat16
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    model.eval()
+    return PrecisionWrapper(model, autocast_dtype, channels_last).eval()
+
+
+def reference_set(count=8, size=128, seed=1234, image_dir=None):
+    """Fixed (cover, secret) tensors in [-1, 1], shape (N, 3, size, size)."""
+    if image_dir:
+        from PIL import Image
+        names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(('.png', '.jpg', '.jpeg')))
+        if len(names) >= 2:
+            arrs = [np.asarray(Image.open(os.path.join(image_dir, n)).convert('RGB').resize((size, size)))
+                    for n in names[:2 * count]]
+            t = torch.from_numpy(np.stack(arrs)).permute(0, 3, 1, 2).float() / 127.5 - 1
+            half = len(t) // 2
+            return t[:half], t[half:2 * half]
+    # Synthetic but deterministic: smooth gradients with texture as covers,
+    # high-contrast blocky patterns (text-like) as secrets
+    g = torch.Generator().manual_seed(seed)
+    ramp = torch.linspace(-1, 1, size)
+    base = (ramp.view(1, 1, size, 1) * torch.rand(count, 3, 1, 1, generator=g) +
+            ramp.view(1, 1, 1, size) * torch.rand(count, 3, 1, 1, generator=g))
+    covers = (base + 0.2 * torch.randn(count, 3, size, size, generator=g)).clamp(-1, 1)
+    blocks = torch.rand(count, 1, size // 8, size // 8, generator=g) > 0.5
+    secrets = nn.functional.interpolate(blocks.float(), scale_factor=8).repeat(1, 3, 1, 1) * 2 - 1
+    return covers, secrets
+
+
+def _psnr(a, b):
+    mse = torch.mean(((a - b) * 0.5) ** 2, dim=(1, 2, 3)).clamp_min(1e-10)
+    return float(torch.mean(10 * torch.log10(1.0 / mse)))
+
+
+def evaluate(encoder, decoder, covers, secrets):
+    with torch.no_grad():
+        stego = encoder(covers, secrets).float().clamp(-1, 1)
+        recovered = decoder(stego).float().clamp(-1, 1)
+    return {'cover_psnr': round(_psnr(stego, covers), 3), 'secret_psnr': round(_psnr(recovered, secrets), 3)}
+
+
+def check_precision(baseline, candidate, covers, secrets, tolerance_db):
+    base = evaluate(*baseline, covers, secrets)
+    cand = evaluate(*candidate, covers, secrets)
+    drops = {k: round(base[k] - cand[k], 3) for k in base}
+    ok = all(d <= tolerance_db for d in drops.values())
+    return ok, {'baseline': base, 'candidate': cand, 'drop_db': drops, 'tolerance_db': tolerance_db, 'passed': ok}
+
+
+def select_precision(encoder, decoder, mode='fp32', channels_last=False, tolerance_db=0.5, image_dir=None):
+    """Returns (encoder, decoder, report) for the requested mode, or the fp32 models if it fails the guard."""
+    if mode == 'bf16' and not cpu_supports_bf16():
+        logger.warning("bf16 requested but this CPU has no native bf16 support; staying on fp32.")
+        mode = 'fp32'
+    if mode == 'fp32' and not channels_last:
+        return encoder, decoder, {'mode': 'fp32', 'channels_last': False}
+    try:
+        candidate = (apply_precision(encoder, mode, channels_last), apply_precision(decoder, mode, channels_last))
+    except ValueError as e:
+        logger.error(f"Precision mode {mode} is not applicable, staying on fp32: {e}")
+        return encoder, decoder, {'mode': 'fp32', 'channels_last': False, 'rejected': mode, 'reason': str(e)}
+    covers, secrets = reference_set(image_dir=image_dir)
+    ok, report = check_precision((encoder, decoder), candidate, covers, secrets, tolerance_db)
+    if not ok:
+        logger.error(f"Precision mode {mode} (channels_last={channels_last}) failed the accuracy guard: {report}")
+        return encoder, decoder, {'mode': 'fp32', 'channels_last': False, 'rejected': mode, 'guard': report}
+    logger.info(f"Precision mode {mode} (channels_last={channels_last}) passed the accuracy guard: {report}")
+    return candidate[0], candidate[1], {'mode': mode, 'channels_last': channels_last, 'guard': report}
+
+
+if __name__ == '__main__':
+    import time
+    from model_loader import load_models
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Check a reduced-precision mode against the fp32 baseline')
+    parser.add_argument('--mode', choices=MODES, default='int8')
+    parser.add_argument('--channels-last', action='store_true')
+    parser.add_argument('--tolerance-db', type=float, default=0.5)
+    parser.add_argument('--image-dir', default=None)
+    args = parser.parse_args()
+
+    encoder, decoder = load_models(torch.device('cpu'), prefer_scripted=False)
+    covers, secrets = reference_set(image_dir=args.image_dir)
+    try:
+        candidate = (apply_precision(encoder, args.mode, args.channels_last),
+                     apply_precision(decoder, args.mode, args.channels_last))
+    except ValueError as e:
+        print(e)
+        raise SystemExit(1)
+    ok, report = check_precision((encoder, decoder), candidate, covers, secrets, args.tolerance_db)
+    for name, (enc, dec) in (('fp32', (encoder, decoder)), (args.mode, candidate)):
+        with torch.no_grad():
+            enc(covers, secrets)
+            started = time.perf_counter()
+            for _ in range(5):
+                dec(enc(covers, secrets))
+        print(f"{name:>5}: {(time.perf_counter() - started) / 5 / len(covers) * 1000:.2f} ms/image")
+    print(report)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,155 @@
+"""Image quality metrics (PSNR, SSIM, MS-SSIM) on batched tensors.
+
+Inputs are (N, C, H, W) tensors in the models' [-1, 1] range; every metric
+returns one value per image. SSIM uses the standard 11x11, sigma 1.5 Gaussian
+window, applied separably.
+
+    python backend/quality.py --sizes 128 512 1024 --batch 8
+"""
+import time
+import argparse
+from functools import lru_cache
+
+import torch
+import torch.nn.functional as F
+
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+_C1 = 0.01 ** 2
+_C2 = 0.03 ** 2
+
+
+@lru_cache(maxsize=8)
+def gaussian_window(size=11, sigma=1.5):
+    x = torch.arange(size, dtype=torch.float32) - (size - 1) / 2
+    w = torch.exp(-(x ** 2) / (2 * sigma ** 2))
+    return w / w.sum()
+
+
+def _to_unit(x):
+    return ((x.float() + 1) * 0.5).clamp_(0, 1)
+
+
+# Above this side length the banded matmul costs more than a depthwise convolution
+MATMUL_BLUR_MAX_SIDE = 1024
+
+
+@lru_cache(maxsize=32)
+def _band(n, size, sigma):
+    # (n, n - size + 1) Toeplitz matrix: x @ band is a 'valid' 1-D Gaussian filter along x's last dim
+    win = gaussian_window(size, sigma)
+    band = torch.zeros(n, n - size + 1)
+    for i in range(n - size + 1):
+        band[i:i + size, i] = win
+    return band
+
+
+def _blur(x, size, sigma):
+    # Separable Gaussian, 'valid' padding. CPU depthwise convolutions are slow, so
+    # moderate sizes run as two BLAS matmuls with banded matrices instead.
+    h, w = x.shape[-2:]
+    if max(h, w) <= MATMUL_BLUR_MAX_SIDE:
+        return _band(h, size, sigma).to(x.device).t() @ (x @ _band(w, size, sigma).to(x.device))
+    c = x.shape[1]
+    win = gaussian_window(size, sigma).to(x.device)
+    x = F.conv2d(x, win.view(1, 1, 1, size).expand(c, 1, 1, size), groups=c)
+    return F.conv2d(x, win.view(1, 1, size, 1).expand(c, 1, size, 1), groups=c)
+
+
+def _ssim_and_cs(x, y, win_size, sigma):
+    # Images smaller than the window get the largest odd window that fits
+    win_size = min(win_size, x.shape[-2], x.shape[-1])
+    win_size -= 1 - win_size % 2
+    mu_x, mu_y = _blur(x, win_size, sigma), _blur(y, win_size, sigma)
+    xx, yy, xy = (_blur(m, win_size, sigma) for m in (x * x, y * y, x * y))
+    mu_xx, mu_yy, mu_xy = mu_x * mu_x, mu_y * mu_y, mu_x * mu_y
+    sigma_x, sigma_y, sigma_xy = xx - mu_xx, yy - mu_yy, xy - mu_xy
+    cs = (2 * sigma_xy + _C2) / (sigma_x + sigma_y + _C2)
+    ssim_map = (2 * mu_xy + _C1) / (mu_xx + mu_yy + _C1) * cs
+    return ssim_map.mean(dim=(1, 2, 3)), cs.mean(dim=(1, 2, 3))
+
+
+def psnr(x, y):
+    mse = torch.mean((_to_unit(x) - _to_unit(y)) ** 2, dim=(1, 2, 3)).clamp_min(1e-10)
+    return 10 * torch.log10(1.0 / mse)
+
+
+def ssim(x, y, win_size=11, sigma=1.5, downsample=True):
+    x, y = _to_unit(x), _to_unit(y)
+    if downsample:
+        # As in the reference implementation: large images are scored at ~256px on the short side
+        f = max(1, round(min(x.shape[-2:]) / 256))
+        if f > 1:
+            x, y = F.avg_pool2d(x, f), F.avg_pool2d(y, f)
+    return _ssim_and_cs(x, y, win_size, sigma)[0]
+
+
+def ms_ssim(x, y, win_size=11, sigma=1.5):
+    """Multi-scale SSIM with as many of the 5 standard scales as the image size allows.
+
+    At 128x128 that is 4 scales; the weights of the scales used are renormalised.
+    """
+    x, y = _to_unit(x), _to_unit(y)
+    min_side = min(x.shape[-2:])
+    levels = 1
+    while levels < len(MS_SSIM_WEIGHTS) and min_side >> levels >= win_size:
+        levels += 1
+    weights = torch.tensor(MS_SSIM_WEIGHTS[:levels], device=x.device)
+    weights = weights / weights.sum()
+    values = []
+    for level in range(levels):
+        s, cs = _ssim_and_cs(x, y, win_size, sigma)
+        if level < levels - 1:
+            values.append(cs.clamp_min(0))
+            x, y = F.avg_pool2d(x, 2), F.avg_pool2d(y, 2)
+        else:
+            values.append(s.clamp_min(0))
+    return torch.prod(torch.stack(values, dim=1) ** weights, dim=1)
+
+
+def metric_names(with_ms_ssim=False):
+    return ('psnr', 'ssim', 'ms_ssim') if with_ms_ssim else ('psnr', 'ssim')
+
+
+def score_batch(covers, stegos, with_ms_ssim=False):
+    """(N, len(metric_names())) tensor of metrics for N cover/stego pairs."""
+    with torch.no_grad():
+        cols = [psnr(covers, stegos), ssim(covers, stegos)]
+        if with_ms_ssim:
+            cols.append(ms_ssim(covers, stegos))
+    return torch.stack(cols, dim=1)
+
+
+def as_dict(row, with_ms_ssim=False):
+    values = row.tolist()
+    return {name: round(v, 2 if name == 'psnr' else 4) for name, v in zip(metric_names(with_ms_ssim), values)}
+
+
+def _bench(fn, *args, repeat=5):
+    fn(*args)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - started) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cost per image of the quality metrics')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[128, 256, 512, 1024])
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    print(f"{'size':>6} {'psnr':>9} {'ssim':>9} {'ms_ssim':>9} {'ssim x1':>9} {'ssim full':>10}   (ms/image, batch {args.batch})")
+    g = torch.Generator().manual_seed(0)
+    with torch.no_grad():
+        for size in args.sizes:
+            covers = torch.rand(args.batch, 3, size, size, generator=g) * 2 - 1
+            stegos = (covers + 0.05 * torch.randn(covers.shape, generator=g)).clamp(-1, 1)
+            per = [_bench(fn, covers, stegos) / args.batch * 1000 for fn in (psnr, ssim, ms_ssim)]
+            # Same images scored one at a time, as an unbatched inline call would
+            single = _bench(lambda c, s: [ssim(c[i:i + 1], s[i:i + 1]) for i in range(len(c))],
+                            covers, stegos) / args.batch * 1000
+            full = _bench(lambda c, s: ssim(c, s, downsample=False), covers, stegos) / args.batch * 1000
+            print(f"{size:>6} {per[0]:>9.3f} {per[1]:>9.3f} {per[2]:>9.3f} {single:>9.3f} {full:>10.3f}")
@@ -0,0 +1,286 @@
+"""Batch attack-robustness evaluation.
+
+Applies a grid of attack types x strengths to a set of stego images, in memory
+and on whole uint8 batches, decodes every attacked batch and scores how close
+each recovery is to the recovery from the clean image.
+
+    python backend/robustness.py --images backend/storage --grid noise=0.05,0.1 jpeg=50,20 --out report.json
+"""
+import io
+import os
+import math
+import json
+import time
+import argparse
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Mirrors the strengths of the single-image attack helpers in server.py
+DEFAULT_GRID = {
+    'noise': [0.05, 0.1],
+    'blur': [1, 2],
+    'jpeg': [50, 20],
+    'crop': [0.1, 0.25],
+}
+# Blur cost grows with the radius (6 * radius + 1 taps per axis)
+MAX_BLUR_RADIUS = 20
+# Valid strengths per attack, as a check and its description
+STRENGTH_RANGES = {
+    'noise': (lambda s: s >= 0, '>= 0'),
+    'blur': (lambda s: 0 < s <= MAX_BLUR_RADIUS, f'in (0, {MAX_BLUR_RADIUS}]'),
+    'jpeg': (lambda s: 1 <= s <= 95, 'in [1, 95]'),
+    'crop': (lambda s: 0 <= s < 1, 'in [0, 1)'),
+}
+
+
+def attack_noise(batch, factor, rng):
+    noise = rng.standard_normal(batch.shape, dtype=np.float32) * (255 * factor)
+    return np.clip(batch.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def _gaussian_kernel(sigma):
+    radius = max(1, int(np.ceil(3 * sigma)))
+    x = np.arange(-radius, radius + 1, dtype=np.float32)
+    k = np.exp(-(x ** 2) / (2 * sigma ** 2))
+    return k / k.sum()
+
+
+def attack_blur(batch, radius, rng=None):
+    # Separable Gaussian (PIL's GaussianBlur radius is the standard deviation),
+    # one shifted multiply-add per tap over the whole batch
+    k = _gaussian_kernel(float(radius))
+    r = len(k) // 2
+    out = batch.astype(np.float32)
+    for axis in (1, 2):
+        pad = [(0, 0)] * 4
+        pad[axis] = (r, r)
+        padded = np.pad(out, pad, mode='edge')
+        acc = np.zeros_like(out)
+        size = out.shape[axis]
+        for i, w in enumerate(k):
+            acc += w * np.take(padded, np.arange(i, i + size), axis=axis)
+        out = acc
+    return np.clip(out + 0.5, 0, 255).astype(np.uint8)
+
+
+def attack_jpeg(batch, quality, rng=None):
+    # JPEG can't be vectorised; round-trip each image through an in-memory buffer
+    out = np.empty_like(batch)
+    for i, arr in enumerate(batch):
+        buf = io.BytesIO()
+        Image.fromarray(arr).save(buf, format='JPEG', quality=int(quality))
+        buf.seek(0)
+        out[i] = np.asarray(Image.open(buf).convert('RGB'))
+    return out
+
+
+def attack_crop(batch, percentage, rng):
+    n, h, w, _ = batch.shape
+    size = int(h * percentage)
+    ys = rng.integers(0, h - size + 1, n)
+    xs = rng.integers(0, w - size + 1, n)
+    rows = np.arange(h)[None, :, None]
+    cols = np.arange(w)[None, None, :]
+    inside = ((rows >= ys[:, None, None]) & (rows < ys[:, None, None] + size) &
+              (cols >= xs[:, None, None]) & (cols < xs[:, None, None] + size))
+    out = batch.copy()
+    out[inside] = 0
+    return out
+
+
+ATTACKS = {
+    'noise': attack_noise,
+    'blur': attack_blur,
+    'jpeg': attack_jpeg,
+    'crop': attack_crop,
+}
+
+
+def _strength(attack, value):
+    try:
+        strength = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{attack} strength must be a number, got {value!r}')
+    valid, description = STRENGTH_RANGES[attack]
+    if not (math.isfinite(strength) and valid(strength)):
+        raise ValueError(f'{attack} strength must be {description}, got {value!r}')
+    return strength
+
+
+def parse_grid(grid, max_cells=None):
+    """(attack, strength) cells of a {attack: strength or [strengths]} grid; ValueError if invalid."""
+    if not isinstance(grid, dict):
+        raise ValueError('attacks must be an object of attack: [strengths]')
+    cells = []
+    for attack, strengths in grid.items():
+        if attack not in ATTACKS:
+            raise ValueError(f"Unknown attack '{attack}' (expected one of {', '.join(ATTACKS)})")
+        if not isinstance(strengths, (list, tuple)):
+            strengths = [strengths]
+        for strength in strengths:
+            cells.append((attack, _strength(attack, strength)))
+    if not cells:
+        raise ValueError('attacks has no strengths to evaluate')
+    if max_cells is not None and len(cells) > max_cells:
+        raise ValueError(f'At most {max_cells} attack cells per run, got {len(cells)}')
+    return cells
+
+
+def _apply_cell(args):
+    batch, attack, strength, seed = args
+    started = time.perf_counter()
+    attacked = ATTACKS[attack](batch, strength, np.random.default_rng(seed))
+    return attack, strength, attacked, time.perf_counter() - started
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def attack_pool(workers):
+    # Spawned workers are slow to start, so the pool is kept for the life of the process
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def load_images(sources, size):
+    """Loads image files (or every image in a folder) as a (N, size, size, 3) uint8 batch."""
+    paths = []
+    for src in sources:
+        if os.path.isdir(src):
+            for root, _, names in os.walk(src):
+                paths.extend(os.path.join(root, n) for n in sorted(names)
+                             if n.lower().endswith(('.png', '.jpg', '.jpeg')) and not n.startswith('.'))
+        else:
+            paths.append(src)
+    return paths, stack_images([Image.open(p) for p in paths], size)
+
+
+def stack_images(images, size):
+    return np.stack([np.asarray(img.convert('RGB').resize((size, size), Image.BILINEAR)) for img in images])
+
+
+def _to_tensor(batch):
+    import torch
+    return torch.from_numpy(batch).permute(0, 3, 1, 2).float().div_(127.5).sub_(1.0)
+
+
+def _decode_all(batch, decode_fn, batch_size):
+    import torch
+    outs = []
+    with torch.no_grad():
+        for start in range(0, len(batch), batch_size):
+            outs.append(decode_fn(_to_tensor(batch[start:start + batch_size])).float())
+    return torch.cat(outs)
+
+
+def _psnr_per_image(a, b):
+    import torch
+    mse = torch.mean(((a - b) * 0.5) ** 2, dim=(1, 2, 3)).clamp_min(1e-10)
+    return 10 * torch.log10(1.0 / mse)
+
+
+def evaluate(images, decode_fn, grid=None, batch_size=32, workers=0, seed=0, report=None):
+    """Scores decoder recovery for every (attack, strength) cell.
+
+    images is a (N, H, W, 3) uint8 batch. Quality is measured against the
+    recovery from the un-attacked image, since stored stego images carry no
+    ground-truth secret.
+    """
+    report = report or (lambda stage, progress: None)
+    cells = parse_grid(grid or DEFAULT_GRID)
+    timings = {}
+
+    report('decode_clean', 0.05)
+    started = time.perf_counter()
+    reference = _decode_all(images, decode_fn, batch_size)
+    timings['decode_clean'] = time.perf_counter() - started
+
+    report('attack', 0.2)
+    started = time.perf_counter()
+    jobs = [(images, attack, strength, seed + i) for i, (attack, strength) in enumerate(cells)]
+    if workers > 0:
+        attacked = list(attack_pool(workers).map(_apply_cell, jobs))
+    else:
+        attacked = [_apply_cell(j) for j in jobs]
+    timings['attack'] = time.perf_counter() - started
+    timings['attack_cpu'] = {f'{a}:{s:g}': round(t, 4) for a, s, _, t in attacked}
+
+    started = time.perf_counter()
+    results = []
+    for i, (attack, strength, batch, _) in enumerate(attacked):
+        report('decode_attacked', 0.3 + 0.65 * i / len(attacked))
+        recovered = _decode_all(batch, decode_fn, batch_size)
+        psnr = _psnr_per_image(recovered, reference)
+        results.append({
+            'attack': attack,
+            'strength': strength,
+            'psnr_mean': round(float(psnr.mean()), 3),
+            'psnr_min': round(float(psnr.min()), 3),
+            'mae': round(float((recovered - reference).abs().mean() * 0.5), 5),
+        })
+    timings['decode_attacked'] = time.perf_counter() - started
+    timings = {k: (round(v, 4) if isinstance(v, float) else v) for k, v in timings.items()}
+    return {'images': int(len(images)), 'cells': results, 'timings': timings}
+
+
+def _parse_grid_args(items):
+    grid = {}
+    for item in items:
+        attack, _, values = item.partition('=')
+        grid[attack] = [float(v) for v in values.split(',') if v]
+    return grid
+
+
+if __name__ == '__main__':
+    import torch
+    from model_loader import load_models
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Batch attack-robustness evaluation of stego images')
+    parser.add_argument('--images', nargs='+', required=True, help='Image files or folders')
+    parser.add_argument('--grid', nargs='*', default=None, help='attack=s1,s2 ... (default: built-in grid)')
+    parser.add_argument('--img-size', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='Write the JSON report here')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    _, decoder = load_models(torch.device('cpu'))
+    paths, images = load_images(args.images, args.img_size)
+    load_time = time.perf_counter() - started
+    result = evaluate(images, decoder, _parse_grid_args(args.grid) if args.grid else None,
+                      args.batch_size, args.workers, args.seed)
+    result['timings']['load'] = round(load_time, 4)
+
+    shutdown()
+    for cell in result['cells']:
+        print(f"{cell['attack']:>6} {cell['strength']:>6g}  psnr {cell['psnr_mean']:7.2f} dB (min {cell['psnr_min']:.2f})  mae {cell['mae']:.4f}")
+    print(json.dumps(result['timings']))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,126 @@
+"""Socket.IO message-queue backends shared by several server processes.
+
+STEGO_SOCKETIO_MESSAGE_QUEUE selects the backend:
+  (unset)           single process, no queue
+  local[://channel] in-process bus; several Socket.IO servers in one process
+                    share delivery (the stand-in used by tests and the benchmark)
+  redis://...       any URL Flask-SocketIO understands (redis, kombu, kafka, zmq)
+
+    python backend/socket_broker.py --clients 1000 5000 10000
+"""
+import time
+import queue
+import argparse
+import threading
+
+import socketio
+
+
+class LocalBus:
+    """Fan-out of published messages to every subscriber of a channel."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(q)
+        return q
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for q in subscribers:
+            q.put(message)
+
+
+_default_bus = LocalBus()
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    name = 'local'
+
+    def __init__(self, channel='socketio', bus=None, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus or _default_bus
+        self._inbox = None if write_only else self.bus.subscribe(channel)
+
+    def _publish(self, data):
+        self.bus.publish(self.channel, self.json.dumps(data))
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+def socketio_options(message_queue, channel='stegochat'):
+    """Keyword arguments for SocketIO(app, ...) for a STEGO_SOCKETIO_MESSAGE_QUEUE value."""
+    if not message_queue:
+        return {}
+    if message_queue == 'local' or message_queue.startswith('local://'):
+        return {'client_manager': LocalPubSubManager(message_queue[len('local://'):] or channel)}
+    return {'message_queue': message_queue, 'channel': channel}
+
+
+def _fake_server(manager, sent):
+    server = socketio.Server(async_mode='threading', client_manager=manager)
+
+    def send(eio_sid, pkt):
+        sent[0] += 1
+        sent[1] += len(pkt.encode())
+    server._send_eio_packet = send
+    # Normally done on the first real connection; starts the queue listener thread
+    server.manager_initialized = True
+    server.manager.initialize()
+    return server
+
+
+def _connect_clients(server, count, offset=0):
+    for i in range(offset, offset + count):
+        sid = server.manager.connect(f'eio-{i}', '/')
+        server.manager.enter_room(sid, '/', f'user:u{i}')
+        server.manager.enter_room(sid, '/', 'global')
+
+
+def _time_emit(server, sent, to, payload, repeat):
+    sent[0] = sent[1] = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        server.emit('new_message_alert', payload, to=to)
+    return (time.perf_counter() - started) / repeat * 1000, sent[0] // repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Socket.IO fan-out cost: broadcast vs. rooms')
+    parser.add_argument('--clients', nargs='+', type=int, default=[100, 1000, 5000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = {'id': 1, 'stego_image': '/storage/' + 'a' * 64 + '.png', 'timestamp': '12:00 PM',
+               'metrics': {'psnr': 36.5, 'ssim': 0.99}, 'sender': 'u0', 'receiver': 'u1', 'is_encrypted': False}
+    print(f"{'clients':>8} {'broadcast':>16} {'targeted':>16} {'via queue':>16}   (ms per emit / packets sent)")
+    for n in args.clients:
+        sent = [0, 0]
+        server = _fake_server(socketio.Manager(), sent)
+        _connect_clients(server, n)
+        broadcast = _time_emit(server, sent, None, payload, args.repeat)
+        targeted = _time_emit(server, sent, ['user:u0', 'user:u1'], payload, args.repeat)
+
+        # Two "processes" on one in-process bus, clients split between them; the
+        # receiver is on the other server, so delivery has to go through the queue
+        bus = LocalBus()
+        sent_a, sent_b = [0, 0], [0, 0]
+        server_a = _fake_server(LocalPubSubManager('bench', bus), sent_a)
+        server_b = _fake_server(LocalPubSubManager('bench', bus), sent_b)
+        _connect_clients(server_a, n // 2)
+        _connect_clients(server_b, n - n // 2, offset=n // 2)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            server_a.emit('new_message_alert', payload, to=['user:u0', f'user:u{n - 1}'])
+        while sent_b[0] < args.repeat:
+            time.sleep(0.0005)
+        queued = (time.perf_counter() - started) / args.repeat * 1000
+        print(f"{n:>8} {broadcast[0]:>9.3f} / {broadcast[1]:<5} {targeted[0]:>9.3f} / {targeted[1]:<5} "
+              f"{queued:>9.3f} / {(sent_a[0] + sent_b[0]) // args.repeat:<5}")
@@ -0,0 +1,273 @@
+"""Content-addressed image storage.
+
+Keys look like ``[prefix]<sha256>.png``. Identical bytes always map to the same
+key, so repeated writes of the same output are deduplicated. Keys are flat
+(no slashes), so they can be used directly in ``/storage/<key>`` URLs. The
+local backend shards files into ``ab/cd/`` subdirectories under the hood.
+"""
+import io
+import os
+import re
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+_KEY_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,254}$')
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+_TMP_PREFIX = '.tmp-'
+
+# One stored object: key, size in bytes, last write (epoch seconds)
+Entry = namedtuple('Entry', 'key size mtime')
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+def validate_key(key):
+    if not key or not _KEY_RE.match(key) or '..' in key:
+        raise InvalidKey(f'Invalid storage key: {key!r}')
+    return key
+
+
+def content_digest(key):
+    """The sha256 a key was derived from, or None for legacy (timestamp-named) keys."""
+    stem = os.path.splitext(key)[0]
+    digest = stem.rsplit('_', 1)[-1]
+    return digest if _DIGEST_RE.match(digest) else None
+
+
+def make_key(data, ext='.png', prefix=''):
+    return f"{prefix}{hashlib.sha256(data).hexdigest()}{ext}"
+
+
+class StorageBackend:
+    """Interface shared by every storage backend."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'puts': 0, 'dedup_hits': 0, 'bytes_written': 0, 'reads': 0, 'deletes': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def put(self, data, ext='.png', prefix=''):
+        raise NotImplementedError
+
+    def open(self, key):
+        """A readable binary file object; raises FileNotFoundError if missing."""
+        raise NotImplementedError
+
+    def get(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def iter_entries(self):
+        """Lazily yields an Entry per stored object, in no particular order."""
+        raise NotImplementedError
+
+    def compact(self, older_than):
+        """Drops leftovers of interrupted writes older than older_than seconds; returns how many."""
+        return 0
+
+    def local_path(self, key):
+        """A filesystem path for the key if the backend has one (lets the web tier use sendfile)."""
+        return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, backend=type(self).__name__)
+
+
+class LocalDiskStorage(StorageBackend):
+    def __init__(self, root, fsync=False):
+        super().__init__()
+        self.root = root
+        self.fsync = fsync
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        validate_key(key)
+        digest = content_digest(key)
+        if digest is None:
+            # Files written before content addressing live flat in the root
+            return os.path.join(self.root, key)
+        return os.path.join(self.root, digest[:2], digest[2:4], key)
+
+    def put(self, data, ext='.png', prefix=''):
+        key = make_key(data, ext, prefix)
+        path = self._path(key)
+        if os.path.exists(path):
+            # A dedup hit counts as a fresh write, so the orphan grace period covers it
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                self._count('dedup_hits')
+                return key
+        directory = os.path.dirname(path)
+        # Write to a temp file in the same directory, then rename: readers never see partial files
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=_TMP_PREFIX)
+        except FileNotFoundError:
+            # New shard, or one compact() just removed as empty
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=_TMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            # mkstemp creates 0600 files; stored images are meant to be served
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._count('puts')
+        self._count('bytes_written', len(data))
+        return key
+
+    def open(self, key):
+        f = open(self._path(key), 'rb')
+        self._count('reads')
+        return f
+
+    def exists(self, key):
+        try:
+            return os.path.exists(self._path(key))
+        except InvalidKey:
+            return False
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            return False
+        self._count('deletes')
+        return True
+
+    def local_path(self, key):
+        return self._path(key)
+
+    def iter_entries(self):
+        # Shard by shard with scandir, so a pass never holds the whole listing in memory
+        def scan(directory, depth):
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                return
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.name.startswith('.'):
+                    continue
+                if depth < 2 and entry.is_dir(follow_symlinks=False):
+                    yield from scan(entry.path, depth + 1)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield Entry(entry.name, st.st_size, st.st_mtime)
+        yield from scan(self.root, 0)
+
+    def compact(self, older_than):
+        cutoff = time.time() - older_than
+        removed = 0
+        for top in sorted(os.scandir(self.root), key=lambda e: e.name):
+            if not top.is_dir(follow_symlinks=False) or top.name.startswith('.'):
+                continue
+            for shard in list(os.scandir(top.path)):
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                for entry in list(os.scandir(shard.path)):
+                    if entry.name.startswith(_TMP_PREFIX) and entry.stat().st_mtime < cutoff:
+                        try:
+                            os.remove(entry.path)
+                            removed += 1
+                        except FileNotFoundError:
+                            pass
+                removed += self._remove_if_empty(shard.path, cutoff)
+            removed += self._remove_if_empty(top.path, cutoff)
+        return removed
+
+    @staticmethod
+    def _remove_if_empty(path, cutoff):
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.rmdir(path)
+                return 1
+        except OSError:
+            pass
+        return 0
+
+
+class MemoryStorage(StorageBackend):
+    """Object-store stand-in: keys map to immutable blobs held in memory."""
+
+    def __init__(self):
+        super().__init__()
+        self._blobs = {}
+        self._mtimes = {}
+
+    def put(self, data, ext='.png', prefix=''):
+        key = make_key(data, ext, prefix)
+        with self._lock:
+            self._mtimes[key] = time.time()
+            if key in self._blobs:
+                self._stats['dedup_hits'] += 1
+                return key
+            self._blobs[key] = bytes(data)
+            self._stats['puts'] += 1
+            self._stats['bytes_written'] += len(data)
+        return key
+
+    def open(self, key):
+        validate_key(key)
+        with self._lock:
+            blob = self._blobs.get(key)
+        if blob is None:
+            raise FileNotFoundError(key)
+        self._count('reads')
+        return io.BytesIO(blob)
+
+    def exists(self, key):
+        with self._lock:
+            return key in self._blobs
+
+    def delete(self, key):
+        with self._lock:
+            if self._blobs.pop(key, None) is None:
+                return False
+            self._mtimes.pop(key, None)
+            self._stats['deletes'] += 1
+        return True
+
+    def iter_entries(self):
+        with self._lock:
+            entries = [Entry(k, len(v), self._mtimes[k]) for k, v in self._blobs.items()]
+        return iter(entries)
+
+
+def create_storage(backend, root):
+    if backend == 'local':
+        return LocalDiskStorage(root)
+    if backend == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend '{backend}' (expected 'local' or 'memory')")
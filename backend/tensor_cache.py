@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+
+def sizeof(value):
+    if hasattr(value, 'element_size') and hasattr(value, 'nelement'):
+        return value.element_size() * value.nelement()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    raise TypeError(f'Cannot size cache value of type {type(value).__name__}')
+
+
+class LRUTensorCache:
+    """Thread-safe LRU cache bounded by the total byte size of its values.
+
+    Values are shared with callers, so they must be treated as read-only.
+    """
+
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max(0, int(max_bytes))
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'rejected': 0}
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._stats['misses'] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats['hits'] += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = sizeof(value)
+        with self._lock:
+            if size > self.max_bytes:
+                # Would evict everything and still not fit
+                self._stats['rejected'] += 1
+                return False
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+        return True
+
+    def invalidate(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._bytes -= item[1]
+        return item is not None
+
+    def invalidate_prefix(self, prefix):
+        with self._lock:
+            keys = [k for k in self._items if k.startswith(prefix)]
+            for k in keys:
+                self._bytes -= self._items.pop(k)[1]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['entries'] = len(self._items)
+            s['bytes'] = self._bytes
+        s['max_bytes'] = self.max_bytes
+        lookups = s['hits'] + s['misses']
+        s['hit_rate'] = round(s['hits'] / lookups, 4) if lookups else 0.0
+        return s
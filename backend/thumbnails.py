@@ -0,0 +1,185 @@
+"""On-disk cache of downscaled previews of stored images.
+
+Chat history shows stego images at bubble size, so /storage/<key>?w=<px>
+serves a JPEG preview instead of the full PNG (full-resolution tiled stegos
+run to tens of megabytes). A preview is generated on its first request and
+served from disk afterwards. Stored keys are immutable, so a preview never
+goes stale; it only has to go when its source is deleted.
+
+    python backend/thumbnails.py --messages 50 --tiled 2
+"""
+import io
+import os
+import time
+import zlib
+import tempfile
+import argparse
+import threading
+
+from PIL import Image
+
+from storage import validate_key, content_digest
+
+THUMB_QUALITY = 85
+# Generation of one (key, width) is serialised, so a burst of history loads renders it once
+_LOCK_STRIPES = 64
+
+
+class ThumbnailCache:
+    def __init__(self, root, sizes, quality=THUMB_QUALITY):
+        self.root = root
+        self.sizes = tuple(sorted(sizes))
+        self.quality = quality
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'generated': 0, 'bytes_written': 0, 'deletes': 0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def path(self, key, width):
+        validate_key(key)
+        stem = os.path.splitext(key)[0]
+        digest = content_digest(key) or f'{zlib.crc32(key.encode()):08x}'
+        return os.path.join(self.root, digest[:2], digest[2:4], f'{stem}_w{width}.jpg')
+
+    def get(self, key, width, open_source):
+        """Path of the width-px preview of key, rendering it from open_source() on a miss."""
+        if width not in self.sizes:
+            raise ValueError(f"Thumbnail width must be one of {', '.join(map(str, self.sizes))}")
+        path = self.path(key, width)
+        if os.path.exists(path):
+            self._count('hits')
+            return path
+        with self._locks[hash((key, width)) % _LOCK_STRIPES]:
+            if os.path.exists(path):
+                self._count('hits')
+                return path
+            with open_source() as f:
+                data = render(f, width, self.quality)
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    out.write(data)
+                os.chmod(tmp, 0o644)
+                os.replace(tmp, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                raise
+        self._count('generated')
+        self._count('bytes_written', len(data))
+        return path
+
+    def delete(self, key):
+        """Removes every preview of key, at any width; returns how many there were."""
+        directory = os.path.dirname(self.path(key, 0))
+        prefix = os.path.splitext(key)[0] + '_w'
+        removed = 0
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            if name.startswith(prefix) and name[len(prefix):-4].isdigit():
+                try:
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        self._count('deletes', removed)
+        return removed
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, sizes=list(self.sizes))
+
+
+def render(f, width, quality=THUMB_QUALITY):
+    """JPEG bytes of the image in f, scaled to width px wide (never enlarged)."""
+    img = Image.open(f)
+    if img.format == 'JPEG':
+        img.draft('RGB', (width, width))
+    img = img.convert('RGB')
+    if img.width > width:
+        img = img.resize((width, max(1, round(img.height * width / img.width))), Image.BILINEAR, reducing_gap=3.0)
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+if __name__ == '__main__':
+    import datetime
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description='Bytes and server time per chat-history load')
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--tiled', type=int, default=2, help='how many of them are full-resolution (tiled) stegos')
+    parser.add_argument('--tiled-size', type=int, nargs=2, default=[1600, 1200])
+    parser.add_argument('--loads', type=int, default=5, help='history loads per scenario')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='stego-thumbs-')
+    os.environ.update(STEGO_STORAGE_DIR=os.path.join(workdir, 'storage'), STEGO_THUMB_DIR=os.path.join(workdir, 'thumbs'),
+                      STEGO_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    import server
+    import migrations
+    from db_models import db, Message
+
+    rng = np.random.default_rng(0)
+
+    def stego_png(size):
+        # Stego images are close to noise, which is what makes their PNGs large
+        buf = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)).save(buf, format='PNG')
+        return buf.getvalue()
+
+    with server.app.app_context():
+        migrations.upgrade(db.engine, log=lambda message: None)
+        now = datetime.datetime.utcnow()
+        db.session.add_all([Message(sender='a', receiver='b', timestamp=now + datetime.timedelta(seconds=i),
+                                    stego_image_filename=server.storage.put(
+                                        stego_png(args.tiled_size if i < args.tiled else (128, 128))))
+                            for i in range(args.messages)])
+        db.session.commit()
+
+    client = server.app.test_client()
+
+    def history_load(url_field, validators):
+        page = client.get(f'/messages?limit={args.messages}')
+        total = len(page.data)
+        for m in page.get_json()['messages']:
+            url = m[url_field]
+            headers = {'If-None-Match': validators[url]} if url in validators else {}
+            r = client.get(url, headers=headers)
+            total += len(r.data)
+            if r.headers.get('ETag'):
+                validators[url] = r.headers['ETag']
+        return total
+
+    def scenario(name, url_field, revalidate, skip_images=False):
+        validators = {}
+        byte_counts, cpu, wall = [], 0.0, 0.0
+        for _ in range(args.loads):
+            started, started_cpu = time.perf_counter(), time.process_time()
+            if skip_images:
+                byte_counts.append(len(client.get(f'/messages?limit={args.messages}').data))
+            else:
+                byte_counts.append(history_load(url_field, validators if revalidate else {}))
+            wall += time.perf_counter() - started
+            cpu += time.process_time() - started_cpu
+        print(f'{name:<36} first {byte_counts[0] / 1024:9.1f} KiB, then {np.mean(byte_counts[1:]) / 1024:9.1f} KiB/load, '
+              f'{wall / args.loads * 1000:7.1f} ms, cpu {cpu / args.loads * 1000:7.1f} ms/load')
+
+    print(f'{args.messages} messages ({args.tiled} at {args.tiled_size[0]}x{args.tiled_size[1]}), {args.loads} loads each')
+    scenario('full images, no validators', 'stegoImage', False)
+    scenario('full images, If-None-Match', 'stegoImage', True)
+    scenario('thumbnails, no validators', 'stegoThumb', False)
+    scenario('thumbnails, If-None-Match', 'stegoThumb', True)
+    scenario('immutable, repeat visit (cached)', 'stegoThumb', True, skip_images=True)
+    print(server.thumbnails.stats())
@@ -0,0 +1,108 @@
+"""Full-resolution encode/decode by running the 128x128 models over overlapping tiles.
+
+Tiles are cut from uint8 arrays, pushed through the model in chunks and
+blended back with linear ramps over the overlap. The image is walked one row
+band at a time and each band is written out as uint8 as soon as no later tile
+can touch it, so float memory stays at about one band plus the chunks in flight.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def tile_positions(length, tile, overlap):
+    """Tile start offsets covering [0, length); the last tile is aligned to the end."""
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def blend_weights(tile, overlap):
+    # Linear ramp over the overlap on every side; never zero, so edges still normalise
+    ramp = np.ones(tile, dtype=np.float32)
+    if overlap > 0:
+        edge = np.arange(1, overlap + 1, dtype=np.float32) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = np.minimum(ramp[-overlap:], edge[::-1])
+    return np.outer(ramp, ramp)
+
+
+def _to_tensor(tiles):
+    import torch
+    return torch.from_numpy(tiles).permute(0, 3, 1, 2).float().div_(127.5).sub_(1.0)
+
+
+def _forward_chunk(forward, inputs, y, xs, tile):
+    import torch
+    stacked = [_to_tensor(np.stack([arr[y:y + tile, x:x + tile] for x in xs])) for arr in inputs]
+    with torch.no_grad():
+        out = forward(*stacked)
+    return out.float().permute(0, 2, 3, 1).cpu().numpy()
+
+
+def run_tiled(forward, inputs, tile=128, overlap=16, chunk_size=16, threads=2):
+    """Applies forward(*batches) -> (n, 3, tile, tile) over tiles of same-sized (H, W, 3) uint8 inputs.
+
+    Returns the stitched (H, W, 3) uint8 output. Inputs smaller than a tile are
+    edge-padded and the output cropped back.
+    """
+    h, w = inputs[0].shape[:2]
+    overlap = max(0, min(int(overlap), tile // 2))
+    if h < tile or w < tile:
+        pad = ((0, max(0, tile - h)), (0, max(0, tile - w)), (0, 0))
+        inputs = [np.pad(arr, pad, mode='edge') for arr in inputs]
+    ph, pw = inputs[0].shape[:2]
+    ys = tile_positions(ph, tile, overlap)
+    xs = tile_positions(pw, tile, overlap)
+    weights = blend_weights(tile, overlap)
+
+    out = np.empty((ph, pw, 3), dtype=np.uint8)
+    # Rolling accumulators for rows [ys[band], ys[band] + tile)
+    acc = np.zeros((tile, pw, 3), dtype=np.float32)
+    wsum = np.zeros((tile, pw), dtype=np.float32)
+    chunks = [(band, y, xs[i:i + chunk_size]) for band, y in enumerate(ys)
+              for i in range(0, len(xs), chunk_size)]
+    chunks_per_band = -(-len(xs) // chunk_size)
+
+    def accumulate(band, chunk_xs, result):
+        for x, t in zip(chunk_xs, result):
+            acc[:, x:x + tile] += t * weights[:, :, None]
+            wsum[:, x:x + tile] += weights
+
+    def flush(band):
+        # Rows above the next band's start are final
+        y = ys[band]
+        done = (ys[band + 1] - y) if band + 1 < len(ys) else tile
+        rows = acc[:done] / wsum[:done, :, None]
+        out[y:y + done] = ((rows * 0.5 + 0.5).clip(0, 1) * 255).astype(np.uint8)
+        acc[:tile - done] = acc[done:]
+        acc[tile - done:] = 0
+        wsum[:tile - done] = wsum[done:]
+        wsum[tile - done:] = 0
+
+    # Results are consumed in submission order with a bounded window, so bands
+    # finish in order and at most max_inflight chunks are held at once.
+    max_inflight = max(1, threads) * 2
+    pending = deque()
+    finished = [0]
+
+    def consume():
+        (band, _, chunk_xs), future = pending.popleft()
+        accumulate(band, chunk_xs, future.result())
+        finished[0] += 1
+        if finished[0] == chunks_per_band:
+            flush(band)
+            finished[0] = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix='tile') as pool:
+        for spec in chunks:
+            pending.append((spec, pool.submit(_forward_chunk, forward, inputs, spec[1], spec[2], tile)))
+            if len(pending) >= max_inflight:
+                consume()
+        while pending:
+            consume()
+    return out[:h, :w]
@@ -0,0 +1,55 @@
+"""Bounded handling of multipart image uploads.
+
+Werkzeug streams each uploaded file into a stream from the request class's
+_get_file_stream(); UploadRequest hands it a spooled buffer that stays in
+memory up to spool_bytes, spills to a temporary file beyond that, and aborts
+the parse with 413 as soon as one file passes max_file_bytes, before the rest
+of the body is read. The whole body is capped separately by MAX_CONTENT_LENGTH.
+"""
+import shutil
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+class CappedSpool(tempfile.SpooledTemporaryFile):
+    def __init__(self, max_bytes, spool_bytes):
+        super().__init__(max_size=spool_bytes, mode='w+b')
+        self.max_bytes = max_bytes
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self.max_bytes and self.written > self.max_bytes:
+            raise RequestEntityTooLarge(f'Uploaded file exceeds {self.max_bytes // (1024 * 1024)} MB')
+        return super().write(data)
+
+
+def make_request_class(max_file_bytes, spool_bytes):
+    class UploadRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return CappedSpool(max_file_bytes, spool_bytes)
+    return UploadRequest
+
+
+def upload_stream(file):
+    """The uploaded file's stream, rewound; None for a missing or empty upload."""
+    if file is None:
+        return None
+    stream = file.stream
+    stream.seek(0, 2)
+    if stream.tell() == 0:
+        return None
+    stream.seek(0)
+    return stream
+
+
+def detach(stream, spool_bytes):
+    # Werkzeug closes upload streams when the request ends; background jobs get their own copy
+    if stream is None:
+        return None
+    copy = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode='w+b')
+    shutil.copyfileobj(stream, copy)
+    copy.seek(0)
+    return copy
@@ -0,0 +1,334 @@
+import os
+import time
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+from batching import QueueFull
+
+logger = logging.getLogger(__name__)
+
+# Respawn delay after a crash doubles per consecutive crash of the same worker, up to the max
+RESTART_BACKOFF = 0.5
+RESTART_BACKOFF_MAX = 30.0
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def _worker_main(worker_id, job_conn, result_conn, num_threads, img_size, encoder_state, decoder_state, shared,
+                 warmup_iters, precision, checkpoint_dir):
+    import torch
+    from model_loader import build_models, load_models
+
+    torch.set_num_threads(num_threads)
+    if encoder_state is None:
+        # Private copies from the exported TorchScript artifacts
+        encoder, decoder = load_models(torch.device('cpu'), checkpoint_dir)
+    else:
+        encoder, decoder = build_models(torch.device('cpu'), encoder_state, decoder_state, assign=shared)
+    mode, channels_last = precision
+    if mode != 'fp32' or channels_last:
+        # The parent has already run the accuracy guard for this mode
+        from precision import apply_precision
+        encoder = apply_precision(encoder, mode, channels_last)
+        decoder = apply_precision(decoder, mode, channels_last)
+
+    with torch.no_grad():
+        dummy = torch.zeros(1, 3, img_size, img_size)
+        for _ in range(warmup_iters):
+            decoder(encoder(dummy, dummy))
+    result_conn.send(('ready', None, os.getpid()))
+
+    while True:
+        try:
+            job = job_conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        job_id, kind, args = job
+        try:
+            with torch.no_grad():
+                if kind == 'encode':
+                    out = encoder(*args)
+                elif kind == 'decode':
+                    out = decoder(*args)
+                else:
+                    raise ValueError(f'Unknown job kind: {kind}')
+            result_conn.send(('result', job_id, out))
+        except Exception as e:
+            result_conn.send(('error', job_id, f'{type(e).__name__}: {e}'))
+
+
+class _Worker:
+    def __init__(self, worker_id, process, job_conn, result_conn):
+        self.id = worker_id
+        self.process = process
+        self.job_conn = job_conn
+        self.result_conn = result_conn
+        self.send_lock = threading.Lock()
+        self.ready = False
+        self.inflight = set()
+
+
+class ModelWorkerPool:
+    """Runs encoder/decoder forward passes in a pool of worker processes.
+
+    Each worker holds its own model copy and a fixed torch thread budget. With
+    share_weights the parent loads the checkpoints once into shared memory and
+    workers map those tensors read-only instead of loading N private copies.
+    Every worker has its own pipes, so a crash can't wedge a shared queue lock;
+    crashed workers are respawned with exponential backoff and their in-flight
+    jobs are failed. A worker that crashes max_restarts times in a row without
+    completing a job (e.g. a bad checkpoint) is given up and the pool is degraded.
+    """
+
+    def __init__(self, num_workers, threads_per_worker=1, img_size=128, share_weights=True,
+                 max_pending=256, warmup_iters=1, ready_timeout=120.0, prefer_scripted=True,
+                 precision=('fp32', False), checkpoint_dir=None, max_restarts=5):
+        import torch.multiprocessing as mp
+        self._ctx = mp.get_context('spawn')
+        self.num_workers = max(1, int(num_workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self.img_size = img_size
+        self.share_weights = share_weights
+        self.max_pending = max(1, int(max_pending))
+        self.warmup_iters = max(0, int(warmup_iters))
+        self.ready_timeout = ready_timeout
+        self.precision = tuple(precision)
+        self.checkpoint_dir = checkpoint_dir
+        self.max_restarts = max(0, int(max_restarts))
+        # Scripted artifacts are fp32-only; reduced precision is applied to eager models
+        self.prefer_scripted = prefer_scripted and self.precision == ('fp32', False)
+
+        self._workers = {}
+        self._pending = {}
+        self._owner = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready_cond = threading.Condition(self._lock)
+        self._running = False
+        self._stopping = False
+        self._encoder_state = None
+        self._decoder_state = None
+        self._stats = {'completed': 0, 'failed': 0, 'rejected': 0, 'restarts': 0}
+        # Consecutive crashes per worker id, reset by a completed job
+        self._crashes = {}
+        self._given_up = set()
+
+    def start(self):
+        import torch
+        from model_loader import CHECKPOINT_DIR, build_models, load_state_dicts, scripted_available, share_state_dict
+        self.checkpoint_dir = self.checkpoint_dir or CHECKPOINT_DIR
+        if not self.share_weights and self.prefer_scripted and scripted_available(self.checkpoint_dir):
+            # Each worker loads the exported artifacts itself
+            enc, dec = None, None
+        else:
+            # Weights are resolved once in the parent so every worker runs the same model,
+            # even when the checkpoints are missing and random weights are used.
+            enc, dec = load_state_dicts(self.checkpoint_dir)
+            if enc is None:
+                encoder, decoder = build_models(torch.device('cpu'))
+                enc, dec = encoder.state_dict(), decoder.state_dict()
+            if self.share_weights:
+                enc, dec = share_state_dict(enc), share_state_dict(dec)
+        self._encoder_state, self._decoder_state = enc, dec
+        self._running = True
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='pool-dispatch', daemon=True)
+        self._dispatcher.start()
+        self.wait_ready(self.ready_timeout)
+        return self
+
+    def model_state(self):
+        return self._encoder_state, self._decoder_state
+
+    def _spawn(self, worker_id):
+        job_recv, job_send = self._ctx.Pipe(duplex=False)
+        result_recv, result_send = self._ctx.Pipe(duplex=False)
+        p = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, job_recv, result_send, self.threads_per_worker, self.img_size,
+                  self._encoder_state, self._decoder_state, self.share_weights, self.warmup_iters,
+                  self.precision, self.checkpoint_dir),
+            name=f'stego-worker-{worker_id}',
+            daemon=True,
+        )
+        p.start()
+        # The child owns these ends now; closing ours lets recv() see EOF if it dies
+        job_recv.close()
+        result_send.close()
+        with self._lock:
+            self._workers[worker_id] = _Worker(worker_id, p, job_send, result_recv)
+
+    def wait_ready(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready_cond:
+            while not all(w.ready for w in self._workers.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    logger.warning(f"Worker pool not fully warmed up after {timeout}s")
+                    return False
+                self._ready_cond.wait(remaining)
+        return True
+
+    def submit(self, kind, *args):
+        if not self._running or self._stopping:
+            raise RuntimeError('Worker pool is not running')
+        future = Future()
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise QueueFull(f'Worker pool queue is full ({self.max_pending} pending)')
+            # Least-loaded ready worker; fall back to any worker while the pool warms up
+            candidates = [w for w in self._workers.values() if w.ready] or list(self._workers.values())
+            if not candidates:
+                raise WorkerCrashed('No model workers available (all crashed or restarting)')
+            worker = min(candidates, key=lambda w: len(w.inflight))
+            job_id = next(self._ids)
+            self._pending[job_id] = future
+            self._owner[job_id] = worker.id
+            worker.inflight.add(job_id)
+        try:
+            with worker.send_lock:
+                worker.job_conn.send((job_id, kind, args))
+        except (OSError, ValueError) as e:
+            self._finish(job_id)
+            future.set_exception(WorkerCrashed(f'Worker {worker.id} unavailable: {e}'))
+        return future
+
+    def run(self, kind, *args, timeout=None):
+        return self.submit(kind, *args).result(timeout=timeout)
+
+    def _finish(self, job_id):
+        with self._lock:
+            future = self._pending.pop(job_id, None)
+            worker_id = self._owner.pop(job_id, None)
+            worker = self._workers.get(worker_id)
+            if worker is not None:
+                worker.inflight.discard(job_id)
+        return future
+
+    def _dispatch_loop(self):
+        while self._running:
+            with self._lock:
+                by_conn = {w.result_conn: w for w in self._workers.values() if not w.result_conn.closed}
+            if not by_conn:
+                time.sleep(0.1)
+                continue
+            for conn in wait(list(by_conn), timeout=0.5):
+                worker = by_conn[conn]
+                try:
+                    msg, job_id, value = conn.recv()
+                except (EOFError, OSError):
+                    self._handle_crash(worker)
+                    continue
+                if msg == 'ready':
+                    with self._ready_cond:
+                        worker.ready = True
+                        self._ready_cond.notify_all()
+                    logger.info(f"Model worker {worker.id} ready (pid {value})")
+                    continue
+                future = self._finish(job_id)
+                with self._lock:
+                    self._stats['completed' if msg == 'result' else 'failed'] += 1
+                    if msg == 'result':
+                        self._crashes.pop(worker.id, None)
+                if future is None:
+                    continue
+                if msg == 'result':
+                    # Clone so the result doesn't pin the worker's shared-memory segment
+                    future.set_result(value.clone())
+                else:
+                    future.set_exception(RuntimeError(value))
+
+    def _handle_crash(self, worker):
+        worker.process.join(1.0)
+        with self._lock:
+            if self._workers.get(worker.id) is not worker:
+                return
+            lost = [(job_id, self._pending.pop(job_id, None)) for job_id in worker.inflight]
+            for job_id, _ in lost:
+                self._owner.pop(job_id, None)
+            worker.inflight.clear()
+            self._stats['failed'] += len(lost)
+        for job_id, future in lost:
+            if future is not None:
+                future.set_exception(WorkerCrashed(f'Worker {worker.id} crashed while running job {job_id}'))
+        worker.job_conn.close()
+        worker.result_conn.close()
+        with self._lock:
+            # Out of the dispatch set until it is respawned
+            del self._workers[worker.id]
+            crashes = self._crashes[worker.id] = self._crashes.get(worker.id, 0) + 1
+            if crashes > self.max_restarts:
+                self._given_up.add(worker.id)
+        if self._stopping:
+            return
+        if crashes > self.max_restarts:
+            logger.error(f"Model worker {worker.id} died {crashes} times in a row (exit code "
+                         f"{worker.process.exitcode}); not respawning it, the pool is degraded")
+            return
+        delay = min(RESTART_BACKOFF * 2 ** (crashes - 1), RESTART_BACKOFF_MAX)
+        logger.error(f"Model worker {worker.id} died (exit code {worker.process.exitcode}), "
+                     f"respawning in {delay:.1f}s (crash {crashes} of {self.max_restarts})")
+        timer = threading.Timer(delay, self._respawn, (worker.id,))
+        timer.daemon = True
+        timer.start()
+
+    def _respawn(self, worker_id):
+        if self._stopping or not self._running:
+            return
+        with self._lock:
+            self._stats['restarts'] += 1
+        self._spawn(worker_id)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['workers'] = self.num_workers
+            s['workers_alive'] = sum(1 for w in self._workers.values() if w.process.is_alive())
+            s['workers_ready'] = sum(1 for w in self._workers.values() if w.ready)
+            s['pending'] = len(self._pending)
+            s['given_up'] = len(self._given_up)
+            s['degraded'] = bool(self._given_up)
+        s['max_pending'] = self.max_pending
+        s['threads_per_worker'] = self.threads_per_worker
+        s['share_weights'] = self.share_weights
+        return s
+
+    def shutdown(self, timeout=10.0):
+        if not self._running or self._stopping:
+            return
+        # Workers drain the jobs already sent to them, then exit on the sentinel;
+        # the dispatcher keeps running until then so those results still arrive.
+        self._stopping = True
+        with self._lock:
+            workers = list(self._workers.values())
+        for w in workers:
+            try:
+                with w.send_lock:
+                    w.job_conn.send(None)
+            except (OSError, ValueError):
+                pass
+        deadline = time.monotonic() + timeout
+        for w in workers:
+            w.process.join(max(0.0, deadline - time.monotonic()))
+            if w.process.is_alive():
+                logger.warning(f"Terminating model worker pid {w.process.pid}")
+                w.process.terminate()
+                w.process.join(1.0)
+        self._running = False
+        self._dispatcher.join(2.0)
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._owner.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError('Worker pool shut down'))
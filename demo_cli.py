@@ -42,7 +42,7 @@ def run_demo():
             
         data = response.json()
         stego_b64 = data.get('stego_image')
-        metrics = data.get('metrics', {})
+        metrics = data.get('metrics') or {}
         
         elapsed = time.time() - start_time
         print(f"✅ Encoding Successful ({elapsed:.2f}s)")
@@ -56,7 +56,7 @@ def run_demo():
     print("\n[2] Verifying Persistence (GET /messages)...")
     try:
         res = requests.get(f"{BASE_URL}/messages")
-        msgs = res.json()
+        msgs = res.json()['messages']
         found = next((m for m in msgs if m['id'] == msg_id), None)
         if found:
             print(f"✅ Message found in DB history!")
@@ -10,8 +10,11 @@ import './index.css';
 // Configure Axios base URL
 const API_BASE = '';
 
-// Socket connection
-const socket = io(window.location.origin);
+// Socket connection; authenticated with the login JWT, so it only connects once logged in
+const socket = io(window.location.origin, {
+  autoConnect: false,
+  auth: (cb) => cb({ token: localStorage.getItem('stego_token') })
+});
 
 function App() {
   const [token, setToken] = useState(localStorage.getItem('stego_token'));
@@ -19,6 +22,9 @@ function App() {
 
   const [messages, setMessages] = useState([]);
   const [isSending, setIsSending] = useState(false);
+  // Cursor of the oldest loaded message while the server has older history (GET /messages?before=)
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
 
   useEffect(() => {
     if (token) {
@@ -29,10 +35,27 @@ function App() {
           return [...prev, { ...newMsg, decodedContent: null, isDecoding: false, error: null }];
         });
       });
+      // One event per room for POST /encode_bulk
+      socket.on('new_message_batch', ({ messages: batch }) => {
+        setMessages(prev => {
+          const seen = new Set(prev.map(m => m.id));
+          const fresh = batch.filter(m => !seen.has(m.id))
+            .map(m => ({ ...m, decodedContent: null, isDecoding: false, error: null }));
+          return fresh.length ? [...prev, ...fresh] : prev;
+        });
+      });
+      // Sent after the message when the server defers quality metrics (STEGO_METRICS=deferred)
+      socket.on('message_metrics', ({ id, metrics }) => {
+        setMessages(prev => prev.map(m => m.id === id ? { ...m, metrics } : m));
+      });
+      socket.connect();
     }
 
     return () => {
       socket.off('new_message_alert');
+      socket.off('new_message_batch');
+      socket.off('message_metrics');
+      socket.disconnect();
     };
   }, [token]);
 
@@ -49,13 +72,16 @@ function App() {
     localStorage.removeItem('stego_token');
     localStorage.removeItem('stego_user');
     setMessages([]);
+    setOlderCursor(null);
   };
 
   const fetchMessages = async () => {
     try {
+      // Latest page of history; older pages are loaded on demand via the `before` cursor
       const res = await axios.get(`${API_BASE}/messages`);
+      setOlderCursor(res.data.has_more_older ? res.data.prev_cursor : null);
       setMessages(prev => {
-        const newMsgs = res.data;
+        const newMsgs = res.data.messages;
         return newMsgs.map(newM => {
           const existing = prev.find(p => p.id === newM.id);
           if (existing) {
@@ -69,6 +95,25 @@ function App() {
     }
   };
 
+  const loadOlderMessages = async () => {
+    if (!olderCursor || isLoadingOlder) return;
+    setIsLoadingOlder(true);
+    try {
+      const res = await axios.get(`${API_BASE}/messages`, { params: { before: olderCursor } });
+      setOlderCursor(res.data.has_more_older ? res.data.prev_cursor : null);
+      setMessages(prev => {
+        const seen = new Set(prev.map(m => m.id));
+        const older = res.data.messages.filter(m => !seen.has(m.id))
+          .map(m => ({ ...m, isDecoding: false, decodedContent: null }));
+        return [...older, ...prev];
+      });
+    } catch (err) {
+      console.error("Failed to load older messages", err);
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   const handleSend = async ({ text, secretFile, coverFile, password }) => {
     setIsSending(true);
     const formData = new FormData();
@@ -101,12 +146,15 @@ function App() {
         stego_image: stegoImage
       });
 
-      const { decoded_content } = response.data;
+      const { decoded_content, payload } = response.data;
 
       setMessages(prev => prev.map(m => m.id === msgId ? {
         ...m,
         isDecoding: false,
-        decodedContent: decoded_content
+        decodedContent: decoded_content,
+        // Binary payloads carry machine-readable text (or the ciphertext, without a password)
+        decodedText: payload?.ok ? (payload.text ?? payload.ciphertext) : null,
+        error: payload && !payload.ok ? payload.error : null
       } : m));
     } catch (error) {
       console.error("Decode error:", error);
@@ -151,6 +199,9 @@ function App() {
           messages={messages}
           currentUser={currentUser}
           onDecode={handleDecode}
+          hasOlder={olderCursor !== null}
+          isLoadingOlder={isLoadingOlder}
+          onLoadOlder={loadOlderMessages}
         />
 
         <MessageInput onSend={handleSend} isSending={isSending} />
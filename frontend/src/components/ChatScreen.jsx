@@ -2,15 +2,22 @@ import React, { useEffect, useRef } from 'react';
 import MessageBubble from './MessageBubble';
 import './components.css';
 
-const ChatScreen = ({ messages, currentUser, onDecode }) => {
+const ChatScreen = ({ messages, currentUser, onDecode, hasOlder, isLoadingOlder, onLoadOlder }) => {
     const bottomRef = useRef(null);
+    // Follow new messages at the bottom, but stay put when older history is prepended
+    const lastId = messages.length ? messages[messages.length - 1].id : null;
 
     useEffect(() => {
         bottomRef.current?.scrollIntoView({ behavior: 'smooth' });
-    }, [messages, currentUser]);
+    }, [lastId, currentUser]);
 
     return (
         <div className="chat-screen">
+            {hasOlder && (
+                <button className="load-older-btn" onClick={onLoadOlder} disabled={isLoadingOlder}>
+                    {isLoadingOlder ? 'Loading...' : 'Load older messages'}
+                </button>
+            )}
             {messages.length === 0 ? (
                 <div style={{ display: 'flex', flexDirection: 'column', alignItems: 'center', justifyContent: 'center', height: '100%', color: 'var(--text-muted)' }}>
                     <p style={{ fontSize: '1.1rem', marginBottom: '10px' }}>No messages yet.</p>
@@ -12,6 +12,8 @@ const MessageBubble = ({ msg, currentUser, onDecode }) => {
     const [showAttackMenu, setShowAttackMenu] = useState(false);
     const [attackedImage, setAttackedImage] = useState(null);
     const [attackType, setAttackType] = useState(null);
+    // How the original was encoded; the attacked copy has no message row of its own
+    const [attackedSource, setAttackedSource] = useState(null);
     const [isAttacking, setIsAttacking] = useState(false);
     const [attackedDecodedContent, setAttackedDecodedContent] = useState(null);
     const [isDecodingAttacked, setIsDecodingAttacked] = useState(false);
@@ -35,6 +37,7 @@ const MessageBubble = ({ msg, currentUser, onDecode }) => {
             });
             setAttackedImage(res.data.attacked_image);
             setAttackType(res.data.attack_type);
+            setAttackedSource({ payload_format: res.data.payload_format, model_version: res.data.model_version });
         } catch (err) {
             console.error("Attack failed", err);
             alert("Attack failed");
@@ -48,7 +51,8 @@ const MessageBubble = ({ msg, currentUser, onDecode }) => {
         setIsDecodingAttacked(true);
         try {
             const res = await axios.post(`${API_BASE}/decode_message`, {
-                stego_image: attackedImage
+                stego_image: attackedImage,
+                ...attackedSource
             });
             setAttackedDecodedContent(res.data.decoded_content);
         } catch (err) {
@@ -63,7 +67,7 @@ const MessageBubble = ({ msg, currentUser, onDecode }) => {
     return (
         <div className={`message-bubble ${isOwn ? 'sent' : 'received'}`}>
             <div className="stego-image-container glass">
-                <img src={msg.stegoImage} alt="Stego Message" className="stego-image" />
+                <img src={msg.stegoThumb || msg.stegoImage} alt="Stego Message" className="stego-image" />
 
                 {/* Attack Button (Overlay) - Available for anyone to test robustness */}
                 <button
@@ -118,7 +122,9 @@ const MessageBubble = ({ msg, currentUser, onDecode }) => {
                         {msg.isDecoding && <span className="loader"></span>}
                     </div>
 
-                    {msg.decodedContent ? (
+                    {msg.decodedText ? (
+                        <p className="decoded-content-text">{msg.decodedText}</p>
+                    ) : msg.decodedContent ? (
                         <img src={msg.decodedContent} alt="Decoded Secret" className="decoded-content-img" />
                     ) : (
                         <div className="text-xs text-center p-4 text-white/50 min-h-[50px] flex items-center justify-center">
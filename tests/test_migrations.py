@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+
+INDEXES = {'ix_message_timestamp_id', 'ix_message_sender_receiver_timestamp_id',
+           'ix_message_receiver_timestamp_id', 'ix_message_stego_image_filename'}
+
+
+def engine_at(tmp_path, name='test.db'):
+    return create_engine(f"sqlite:///{tmp_path / name}")
+
+
+def test_upgrade_from_scratch(tmp_path):
+    engine = engine_at(tmp_path)
+    applied = []
+    assert migrations.upgrade(engine, log=applied.append) == migrations.LATEST
+    assert len(applied) == len(migrations.MIGRATIONS)
+    schema = inspect(engine)
+    assert {'user', 'message', 'schema_version'} <= set(schema.get_table_names())
+    assert INDEXES <= {i['name'] for i in schema.get_indexes('message')}
+    assert {'payload_format', 'model_version'} <= {c['name'] for c in schema.get_columns('message')}
+    assert migrations.status(engine) == {'version': migrations.LATEST, 'latest': migrations.LATEST, 'pending': []}
+
+
+def test_rerun_applies_nothing(tmp_path):
+    engine = engine_at(tmp_path)
+    migrations.upgrade(engine, log=lambda m: None)
+    applied = []
+    assert migrations.upgrade(engine, log=applied.append) == migrations.LATEST
+    assert applied == []
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM schema_version')).scalar() == 1
+
+
+def test_every_migration_is_idempotent(tmp_path):
+    # Forgetting the recorded version replays all of them over the finished schema
+    engine = engine_at(tmp_path)
+    migrations.upgrade(engine, log=lambda m: None)
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM schema_version'))
+    assert migrations.upgrade(engine, log=lambda m: None) == migrations.LATEST
+
+
+def test_upgrade_in_steps(tmp_path):
+    engine = engine_at(tmp_path)
+    assert migrations.upgrade(engine, target=2, log=lambda m: None) == 2
+    assert migrations.status(engine)['pending'] == [(n, d) for n, d, _ in migrations.MIGRATIONS if n > 2]
+    assert migrations.upgrade(engine, log=lambda m: None) == migrations.LATEST
+
+
+def test_old_unversioned_database_is_upgraded(tmp_path):
+    # Databases from before migrations: message table without indexes or the later columns
+    engine = engine_at(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE message (id INTEGER PRIMARY KEY, sender VARCHAR(80), receiver VARCHAR(80), '
+                          'stego_image_filename VARCHAR(200), timestamp DATETIME)'))
+        conn.execute(text("INSERT INTO message (sender, receiver, stego_image_filename) VALUES ('a', 'b', 'x.png')"))
+    assert migrations.upgrade(engine, log=lambda m: None) == migrations.LATEST
+    assert INDEXES <= {i['name'] for i in inspect(engine).get_indexes('message')}
+    with engine.connect() as conn:
+        row = conn.execute(text('SELECT payload_format, model_version FROM message')).one()
+    assert tuple(row) == ('image', 'default')
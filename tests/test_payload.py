@@ -0,0 +1,76 @@
+import base64
+
+import numpy as np
+import pytest
+
+from payload import (PayloadError, capacity, decode_payload, encode_payload, hamming_decode,
+                     hamming_encode, pack_ciphertext, read_frame, unpack_ciphertext)
+
+
+def carrier(data, **kwargs):
+    return np.asarray(encode_payload(data, **kwargs))
+
+
+@pytest.mark.parametrize('data', [b'', b'hi', 'héllo wörld'.encode(), bytes(range(256))])
+def test_roundtrip(data):
+    payload = decode_payload(carrier(data))
+    assert payload.data == data
+    assert not payload.encrypted
+    assert payload.corrected == 0
+
+
+def test_encrypted_flag_and_repeat_roundtrip():
+    payload = decode_payload(carrier(b'\x00' * 40, encrypted=True, repeat=3))
+    assert payload.data == b'\x00' * 40
+    assert payload.encrypted
+    assert payload.repeat == 3
+
+
+def test_capacity_limit():
+    limit = capacity()
+    assert decode_payload(carrier(b'x' * limit)).data == b'x' * limit
+    with pytest.raises(PayloadError):
+        encode_payload(b'x' * (limit + 1))
+    with pytest.raises(PayloadError):
+        encode_payload(b'x' * (capacity(repeat=2) + 1), repeat=2)
+
+
+def test_hamming_corrects_one_bit_per_block():
+    data = b'\xa5\x0f'
+    bits = hamming_encode(data)
+    bits[[0, 9, 20, 27]] ^= 1  # one flip in each of the four 7-bit blocks
+    assert hamming_decode(bits) == (data, 4)
+
+
+def test_heavy_noise_fails_the_crc():
+    data = bytes(range(200))
+    arr = carrier(data, repeat=1).copy()
+    rng = np.random.default_rng(0)
+    mask = rng.random(arr.shape[:2]) < 0.4
+    arr[mask] = rng.integers(0, 256, (int(mask.sum()), 1), dtype=np.uint8)
+    payload, crc_ok = read_frame(arr)
+    assert not crc_ok
+    assert payload.data != data
+    with pytest.raises(PayloadError, match='checksum'):
+        decode_payload(arr)
+
+
+def test_mild_noise_is_corrected():
+    data = b'stego' * 10
+    arr = carrier(data).astype(np.float32)
+    arr += np.random.default_rng(1).normal(0, 40, arr.shape)
+    assert decode_payload(arr.clip(0, 255).astype(np.uint8)).data == data
+
+
+def test_image_without_payload_is_rejected():
+    with pytest.raises(PayloadError):
+        decode_payload(np.full((128, 128, 3), 240, dtype=np.uint8))
+
+
+def test_ciphertext_packing_roundtrip():
+    salt, token = bytes(range(16)), bytes(range(100, 173))
+    ciphertext = f'{base64.urlsafe_b64encode(salt).decode()}:{base64.urlsafe_b64encode(token).decode()}'
+    assert pack_ciphertext(ciphertext) == salt + token
+    assert unpack_ciphertext(pack_ciphertext(ciphertext)) == ciphertext
+    with pytest.raises(PayloadError):
+        unpack_ciphertext(b'\x00' * 16)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from tiling import run_tiled, tile_positions
+
+
+def identity(batch):
+    return batch
+
+
+def image(h, w, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+def assert_close(out, expected):
+    # [-1, 1] round trip truncates, so a value may come back one lower
+    assert out.shape == expected.shape
+    assert out.dtype == np.uint8
+    assert np.abs(out.astype(np.int16) - expected.astype(np.int16)).max() <= 1
+
+
+@pytest.mark.parametrize('shape', [(300, 200), (129, 257), (128, 128), (400, 130)])
+def test_identity_forward_stitches_back_the_input(shape):
+    arr = image(*shape)
+    assert_close(run_tiled(identity, [arr], tile=128, overlap=16, chunk_size=3, threads=2), arr)
+
+
+@pytest.mark.parametrize('shape', [(50, 70), (1, 1), (127, 300), (300, 90)])
+def test_inputs_smaller_than_a_tile_are_padded_and_cropped_back(shape):
+    arr = image(*shape, seed=1)
+    assert_close(run_tiled(identity, [arr], tile=128, overlap=16), arr)
+
+
+def test_forward_gets_every_input_tile_aligned():
+    first, second = image(200, 260, seed=2), image(200, 260, seed=3)
+    out = run_tiled(lambda a, b: b, [first, second], tile=64, overlap=8, chunk_size=2, threads=1)
+    assert_close(out, second)
+
+
+def test_tile_positions_cover_the_length():
+    for length in (1, 127, 128, 129, 300, 1000):
+        starts = tile_positions(length, 128, 16)
+        assert starts[0] == 0
+        assert starts[-1] == max(0, length - 128)
+        assert all(b - a <= 112 for a, b in zip(starts, starts[1:]))